@@ -18,6 +18,19 @@ import signal
 import sys
 import subprocess
 import shlex
+import shutil
+import re
+import difflib
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import urllib.request
+import urllib.parse
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
 
 # Configuración de logging
 logging.basicConfig(
@@ -31,19 +44,1118 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+# Procesadores de frame disponibles para los workers del pipeline.
+# Reciben la vista numpy del slot en memoria compartida y la modifican in-place.
+def _process_frame_none(frame, seq):
+    """No hace nada (solo mide el coste del pipeline)"""
+    pass
+
+
+def _process_frame_timestamp(frame, seq):
+    """Dibuja fecha/hora y número de frame sobre la imagen"""
+    text = f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} #{seq}"
+    cv2.putText(frame, text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX,
+                0.8, (255, 255, 255), 2, cv2.LINE_AA)
+
+
+FRAME_PROCESSORS = {
+    'none': _process_frame_none,
+    'timestamp': _process_frame_timestamp,
+}
+
+
+class SharedFrameRing:
+    """Anillo de frames en memoria compartida (multiprocessing.shared_memory)
+
+    Cada slot es una vista numpy sobre el mismo bloque de memoria, de modo
+    que los procesos se pasan solo el índice del slot, nunca el frame. Al
+    pasarlo a un proceso hijo solo viaja el nombre del bloque: el hijo se
+    adjunta a la misma memoria.
+    """
+    
+    def __init__(self, slots, width, height, channels=3):
+        self.slots = slots
+        self.shape = (height, width, channels)
+        self.frame_bytes = height * width * channels
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * self.frame_bytes)
+        self._frames = self._views()
+    
+    def _views(self):
+        return [
+            np.ndarray(self.shape, dtype=np.uint8, buffer=self.shm.buf,
+                       offset=i * self.frame_bytes)
+            for i in range(self.slots)
+        ]
+    
+    def __getstate__(self):
+        return {'slots': self.slots, 'shape': self.shape, 'name': self.shm.name}
+    
+    def __setstate__(self, state):
+        self.slots = state['slots']
+        self.shape = state['shape']
+        self.frame_bytes = int(np.prod(self.shape))
+        self.shm = shared_memory.SharedMemory(name=state['name'])
+        self._frames = self._views()
+    
+    def frame(self, slot):
+        """Retorna la vista numpy del slot (sin copiar)"""
+        return self._frames[slot]
+    
+    def close(self, unlink=True):
+        """Libera la memoria compartida"""
+        self._frames = []
+        try:
+            self.shm.close()
+            if unlink:
+                self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _pipeline_child_init(stop_event):
+    """Configura señales en un proceso hijo del pipeline
+
+    SIGTERM detiene el loop del hijo limpiamente; SIGINT se ignora porque
+    el proceso de control es quien coordina el apagado.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+
+
+def _pipeline_capture_main(ring, free_queue, ready_queue, control_queue,
+                           stop_event, stats, camera_config, options):
+    """Proceso de captura: escribe frames directamente en el anillo compartido"""
+    _pipeline_child_init(stop_event)
+    parent_pid = os.getppid()
+    source = options.get('source', 'camera')
+    block = options.get('backpressure', 'drop') == 'block'
+    fps = camera_config.get('fps', 30)
+    frame_interval = 1.0 / fps if fps else 0
+    height, width = ring.shape[0], ring.shape[1]
+    camera = None
+    
+    if source == 'camera':
+        camera = cv2.VideoCapture(camera_config['device_id'])
+        camera.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        camera.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        camera.set(cv2.CAP_PROP_FPS, fps)
+        camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        if not camera.isOpened():
+            logger.error("Pipeline: no se pudo abrir la cámara USB")
+            return
+    else:
+        # Fuente sintética para benchmark: patrón fijo más un contador
+        pattern = np.random.randint(0, 255, ring.shape, dtype=np.uint8)
+    
+    seq = 0
+    next_deadline = time.monotonic()
+    scratch = np.empty(ring.shape, dtype=np.uint8)
+    
+    while not stop_event.is_set() and os.getppid() == parent_pid:
+        # Aplicar propiedades de cámara enviadas por el proceso de control
+        try:
+            while True:
+                prop, value = control_queue.get_nowait()
+                if camera is not None:
+                    camera.set(prop, value)
+        except queue.Empty:
+            pass
+        
+        if source != 'camera' and frame_interval:
+            next_deadline += frame_interval
+            delay = next_deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_deadline = time.monotonic()
+        
+        # Backpressure: esperar un slot libre o descartar el frame
+        slot = None
+        while slot is None and not stop_event.is_set():
+            try:
+                slot = free_queue.get(timeout=0.5) if block else free_queue.get_nowait()
+            except queue.Empty:
+                if not block:
+                    break
+        if stop_event.is_set():
+            break
+        
+        target = ring.frame(slot) if slot is not None else scratch
+        
+        if camera is not None:
+            ret, frame = camera.read(target)
+            if not ret:
+                if slot is not None:
+                    free_queue.put(slot)
+                logger.warning("Pipeline: error al capturar frame")
+                continue
+            if frame is not target:
+                # La cámara entregó otra resolución: ajustar al slot
+                cv2.resize(frame, (width, height), dst=target)
+        else:
+            target[:] = pattern
+            target[0, 0, 0] = seq & 0xFF
+        
+        if slot is None:
+            with stats['dropped'].get_lock():
+                stats['dropped'].value += 1
+            continue
+        
+        ready_queue.put((slot, seq, time.monotonic()))
+        seq += 1
+        with stats['captured'].get_lock():
+            stats['captured'].value += 1
+    
+    if camera is not None:
+        camera.release()
+
+
+def _pipeline_worker_main(ring, ready_queue, done_queue, stop_event, stats, processor_name,
+                          worker_slots, index):
+    """Proceso worker: procesa frames del anillo por índice
+
+    worker_slots[index] indica el slot que el worker tiene en proceso (-1 si
+    ninguno), para que el proceso de control lo recupere si el worker muere.
+    """
+    _pipeline_child_init(stop_event)
+    parent_pid = os.getppid()
+    processor = FRAME_PROCESSORS.get(processor_name, _process_frame_none)
+    
+    while not stop_event.is_set() and os.getppid() == parent_pid:
+        try:
+            item = ready_queue.get(timeout=0.2)
+        except queue.Empty:
+            continue
+        if item is None:
+            break
+        
+        slot, seq, captured_at = item
+        worker_slots[index] = slot
+        try:
+            processor(ring.frame(slot), seq)
+        except Exception as e:
+            logger.error(f"Pipeline: error en procesador '{processor_name}': {e}")
+        
+        # Se limpia antes de entregar: si el worker muere entre medio el slot
+        # se pierde, pero nunca se devuelve dos veces al anillo
+        worker_slots[index] = -1
+        done_queue.put((slot, seq, captured_at))
+        with stats['processed'].get_lock():
+            stats['processed'].value += 1
+
+
+class FramePipeline:
+    """Pipeline multiproceso de frames sobre memoria compartida
+
+    Un proceso de captura llena el anillo, N workers procesan frames por
+    índice y el proceso de control (el que tiene el UART) consume los frames
+    en orden y devuelve los slots libres. Si los workers no dan abasto, la
+    captura descarta frames ('drop') o espera ('block').
+    """
+    
+    def __init__(self, config, source='camera'):
+        self.config = config
+        self.options = dict(config.get('pipeline', {}))
+        self.options['source'] = source
+        self.workers = self.options.get('workers', 3)
+        self.slots = self.options.get('slots', 6)
+        self.processor = self.options.get('processor', 'none')
+        self.ring = None
+        self.processes = []
+        self.worker_processes = []
+        self.pending = {}
+        self.next_seq = 0
+        self.gap_since = None
+        # forkserver y no fork: los hijos (y los workers que se reinician desde
+        # CameraThread) nacen de un proceso sin threads, así no heredan locks
+        # tomados por los threads de UART, offload, staging o logging
+        self.ctx = multiprocessing.get_context('forkserver')
+        self.stop_event = self.ctx.Event()
+        self.free_queue = self.ctx.Queue()
+        self.ready_queue = self.ctx.Queue()
+        self.done_queue = self.ctx.Queue()
+        self.control_queue = self.ctx.Queue()
+        self.stats = {
+            'captured': self.ctx.Value('Q', 0),
+            'dropped': self.ctx.Value('Q', 0),
+            'processed': self.ctx.Value('Q', 0),
+        }
+        self.worker_slots = self.ctx.Array('i', [-1] * self.workers)
+        self.consumed = 0
+        self.late = 0
+        self.worker_restarts = 0
+        self.latency_total = 0.0
+    
+    def start(self):
+        """Crea el anillo compartido y lanza los procesos de captura y workers"""
+        camera_config = self.config['camera']
+        self.ring = SharedFrameRing(self.slots, camera_config['width'], camera_config['height'])
+        for slot in range(self.slots):
+            self.free_queue.put(slot)
+        
+        capture = self.ctx.Process(
+            target=_pipeline_capture_main,
+            args=(self.ring, self.free_queue, self.ready_queue, self.control_queue,
+                  self.stop_event, self.stats, camera_config, self.options),
+            name="PipelineCapture",
+            daemon=True
+        )
+        self.processes.append(capture)
+        capture.start()
+        
+        for i in range(self.workers):
+            self.worker_processes.append(self._start_worker(i))
+        
+        logger.info(f"Pipeline multiproceso iniciado: {self.workers} workers, "
+                    f"{self.slots} slots de {self.ring.frame_bytes / 1e6:.1f} MB, "
+                    f"procesador '{self.processor}'")
+    
+    def _start_worker(self, index):
+        worker = self.ctx.Process(
+            target=_pipeline_worker_main,
+            args=(self.ring, self.ready_queue, self.done_queue, self.stop_event,
+                  self.stats, self.processor, self.worker_slots, index),
+            name=f"PipelineWorker-{index}",
+            daemon=True
+        )
+        worker.start()
+        self.processes.append(worker)
+        return worker
+    
+    def _reap_workers(self):
+        """Recupera el slot de un worker caído y lo reemplaza"""
+        for index, worker in enumerate(self.worker_processes):
+            if worker.is_alive() or self.stop_event.is_set():
+                continue
+            slot = self.worker_slots[index]
+            self.worker_slots[index] = -1
+            if slot >= 0:
+                self.release(slot)
+            logger.warning(f"Pipeline: {worker.name} terminó (código {worker.exitcode}), "
+                           f"slot recuperado: {slot if slot >= 0 else 'ninguno'}; reiniciando")
+            self.processes.remove(worker)
+            self.worker_processes[index] = self._start_worker(index)
+            self.worker_restarts += 1
+    
+    def next_frame(self, timeout=0.1):
+        """Retorna (slot, frame) del siguiente frame en orden, o None
+
+        El frame es una vista sobre la memoria compartida: hay que llamar a
+        release(slot) cuando ya no se use.
+        """
+        deadline = time.monotonic() + timeout
+        while self.next_seq not in self.pending:
+            remaining = deadline - time.monotonic()
+            try:
+                slot, seq, captured_at = self.done_queue.get(timeout=max(remaining, 0))
+                if seq < self.next_seq:
+                    # Llegó después de saltarlo: ya no se entrega, solo liberar el slot
+                    self.release(slot)
+                    self.late += 1
+                else:
+                    self.pending[seq] = (slot, captured_at)
+                continue
+            except queue.Empty:
+                pass
+            
+            self._reap_workers()
+            
+            # Si un frame se perdió (worker caído), no bloquear el orden
+            if self.pending:
+                if self.gap_since is None:
+                    self.gap_since = time.monotonic()
+                elif time.monotonic() - self.gap_since > 1.0:
+                    logger.warning(f"Pipeline: frame {self.next_seq} perdido, saltando")
+                    self.next_seq = min(self.pending)
+                    continue
+            return None
+        
+        self.gap_since = None
+        slot, captured_at = self.pending.pop(self.next_seq)
+        self.next_seq += 1
+        self.consumed += 1
+        self.latency_total += time.monotonic() - captured_at
+        return slot, self.ring.frame(slot)
+    
+    def release(self, slot):
+        """Devuelve un slot al anillo para que la captura lo reutilice"""
+        self.free_queue.put(slot)
+    
+    def set_camera_property(self, prop, value):
+        """Envía un ajuste de cámara al proceso de captura"""
+        self.control_queue.put((prop, value))
+    
+    def get_stats(self):
+        """Retorna contadores del pipeline"""
+        return {
+            'workers': self.workers,
+            'slots': self.slots,
+            'captured': self.stats['captured'].value,
+            'dropped': self.stats['dropped'].value,
+            'processed': self.stats['processed'].value,
+            'consumed': self.consumed,
+            'late': self.late,
+            'worker_restarts': self.worker_restarts,
+            'avg_latency_ms': round(self.latency_total / self.consumed * 1000, 2) if self.consumed else None,
+        }
+    
+    def stop(self):
+        """Detiene los procesos hijos y libera la memoria compartida"""
+        if self.ring is None:
+            return
+        
+        self.stop_event.set()
+        for _ in range(self.workers):
+            self.ready_queue.put(None)
+        
+        for process in self.processes:
+            process.join(timeout=2)
+            if process.is_alive():
+                logger.warning(f"Pipeline: forzando terminación de {process.name}")
+                process.terminate()
+                process.join(timeout=1)
+        self.processes = []
+        self.worker_processes = []
+        
+        for q in (self.free_queue, self.ready_queue, self.done_queue, self.control_queue):
+            q.cancel_join_thread()
+            q.close()
+        
+        self.ring.close()
+        self.ring = None
+        logger.info(f"Pipeline detenido: {self.get_stats()}")
+
+
+def run_pipeline_benchmark(duration=10, workers=3, slots=6, processor='none'):
+    """Mide el throughput del pipeline con frames sintéticos a 720p y 1080p"""
+    results = []
+    for width, height in ((1280, 720), (1920, 1080)):
+        config = {
+            'camera': {'device_id': 0, 'width': width, 'height': height, 'fps': 0},
+            'pipeline': {'workers': workers, 'slots': slots,
+                         'processor': processor, 'backpressure': 'block'},
+        }
+        pipeline = FramePipeline(config, source='synthetic')
+        pipeline.start()
+        
+        start = time.monotonic()
+        while time.monotonic() - start < duration:
+            item = pipeline.next_frame(timeout=0.1)
+            if item is not None:
+                pipeline.release(item[0])
+        elapsed = time.monotonic() - start
+        
+        stats = pipeline.get_stats()
+        pipeline.stop()
+        stats.update({
+            'resolution': f'{width}x{height}',
+            'fps': round(stats['consumed'] / elapsed, 1),
+            'mb_per_s': round(stats['consumed'] * width * height * 3 / elapsed / 1e6, 1),
+        })
+        results.append(stats)
+        logger.info(f"Benchmark pipeline {stats['resolution']}: {stats['fps']} fps, "
+                    f"{stats['mb_per_s']} MB/s, latencia media {stats['avg_latency_ms']} ms")
+    return results
+
+
+class SchedulingManager:
+    """Gestiona afinidad de CPU y prioridades de cada carga de trabajo
+
+    Roles:
+    - 'recording': proceso FFmpeg de grabación (cores dedicados)
+    - 'control': threads de control (cámara, proceso principal)
+    - 'uart': thread lector del UART (tiempo real o nice alto)
+    - 'background': trabajos en segundo plano (remux, etc.) con CPU e I/O idle
+    
+    Cada política aplicada se registra con su efecto real, leído de vuelta
+    del kernel, en get_metrics(). Con 'enabled': false no hace nada.
+    """
+    
+    UART_POLICIES = {
+        'fifo': getattr(os, 'SCHED_FIFO', None),
+        'rr': getattr(os, 'SCHED_RR', None),
+    }
+    
+    def __init__(self, config):
+        options = config.get('scheduling', {})
+        self.enabled = options.get('enabled', False)
+        self.all_cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else []
+        self.recording_cpus = self._valid_cpus(options.get('ffmpeg_cpus'))
+        self.control_cpus = self._valid_cpus(options.get('control_cpus'))
+        self.background_cpus = self._valid_cpus(options.get('background_cpus'))
+        self.recording_nice = options.get('ffmpeg_nice', 0)
+        self.uart_policy = options.get('uart_policy', 'fifo')
+        self.uart_priority = options.get('uart_priority', 10)
+        self.uart_nice = options.get('uart_nice', -10)
+        self.background_nice = options.get('background_nice', 19)
+        self.background_ionice = options.get('background_ionice', True)
+        self.metrics = {}
+        self.lock = threading.Lock()
+    
+    def _valid_cpus(self, cpus):
+        """Filtra la lista de cores a los existentes en esta máquina"""
+        if not cpus:
+            return None
+        valid = [cpu for cpu in cpus if cpu in self.all_cpus]
+        if len(valid) != len(cpus):
+            logger.warning(f"Scheduling: cores {cpus} no disponibles, usando {valid}")
+        return valid or None
+    
+    def _record(self, name, report):
+        with self.lock:
+            self.metrics[name] = report
+        logger.info(f"Scheduling {name}: {report}")
+    
+    def apply_to_current_thread(self, role):
+        """Aplica afinidad y prioridad al thread que llama ('control', 'uart' o 'background')"""
+        if not self.enabled:
+            return
+        
+        name = threading.current_thread().name
+        report = {'role': role, 'tid': threading.get_native_id()}
+        cpus = self.background_cpus if role == 'background' else self.control_cpus
+        
+        if cpus:
+            try:
+                os.sched_setaffinity(0, cpus)
+            except OSError as e:
+                report['affinity_error'] = str(e)
+        
+        if role == 'uart':
+            report.update(self._apply_uart_priority())
+        elif role == 'background':
+            report.update(self._apply_background_priority())
+        
+        report['cpus'] = sorted(os.sched_getaffinity(0))
+        report['policy'] = self._policy_name(os.sched_getscheduler(0))
+        report['nice'] = os.getpriority(os.PRIO_PROCESS, 0)
+        self._record(name, report)
+    
+    def _apply_uart_priority(self):
+        """Da prioridad tiempo real al thread UART, o nice alto si no hay permisos"""
+        policy = self.UART_POLICIES.get(self.uart_policy)
+        if policy is not None:
+            try:
+                # RESET_ON_FORK: los procesos lanzados desde este thread no heredan RT
+                os.sched_setscheduler(0, policy | os.SCHED_RESET_ON_FORK,
+                                      os.sched_param(self.uart_priority))
+                return {'priority': os.sched_getparam(0).sched_priority}
+            except (OSError, AttributeError) as e:
+                logger.warning(f"Scheduling: no se pudo usar {self.uart_policy} en UART ({e}), usando nice")
+                fallback = {'realtime_error': str(e)}
+        elif self.uart_policy == 'nice':
+            fallback = {}
+        else:
+            return {}
+        
+        try:
+            os.setpriority(os.PRIO_PROCESS, 0, self.uart_nice)
+        except OSError as e:
+            fallback['nice_error'] = str(e)
+        return fallback
+    
+    def _apply_background_priority(self):
+        """Baja la prioridad de CPU e I/O del thread que llama"""
+        report = {}
+        try:
+            os.setpriority(os.PRIO_PROCESS, 0, self.background_nice)
+        except OSError as e:
+            report['nice_error'] = str(e)
+        
+        # La prioridad de I/O es por thread: ionice acepta el TID como PID
+        tid = threading.get_native_id()
+        if self.background_ionice and shutil.which('ionice'):
+            result = subprocess.run(
+                ['ionice', '-c', '3', '-p', str(tid)],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE
+            )
+            if result.returncode != 0:
+                report['ionice_error'] = result.stderr.decode().strip()
+        report.update(self._read_ionice(tid))
+        return report
+    
+    def _read_ionice(self, pid):
+        """Clase de I/O efectiva de un proceso o thread, leída del kernel con 'ionice -p'"""
+        if not shutil.which('ionice'):
+            return {'ionice_error': 'ionice no disponible'} if self.background_ionice else {}
+        result = subprocess.run(
+            ['ionice', '-p', str(pid)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        if result.returncode != 0:
+            return {'ionice_error': result.stderr.decode().strip()}
+        # 'idle', 'none: prio 4', 'best-effort: prio 4'...
+        io_class = result.stdout.decode().split(':')[0].strip()
+        report = {'ionice': io_class}
+        if self.background_ionice and io_class != 'idle':
+            report['ionice_error'] = f"se pidió clase idle y el kernel reporta '{io_class}'"
+        return report
+    
+    WRAPPERS = ('ionice', 'nice', 'taskset', 'chrt')
+    
+    def prepare_command(self, role, cmd):
+        """Retorna cmd envuelto para lanzarlo con la política del rol
+
+        Se usan taskset, nice, chrt e ionice en lugar de preexec_fn, que no es
+        seguro con threads en marcha. Cada envoltorio hace exec del siguiente,
+        así la política se fija antes de arrancar FFmpeg y sus threads la
+        heredan. Los trabajos 'background' llevan además ionice clase idle.
+        """
+        if not self.enabled:
+            return cmd
+        
+        if role == 'recording':
+            cpus = self.recording_cpus or self.all_cpus
+            nice = self.recording_nice
+        else:
+            cpus = self.background_cpus or self.all_cpus
+            nice = self.background_nice
+        
+        prefix = []
+        if role == 'background' and self.background_ionice and shutil.which('ionice'):
+            prefix += ['ionice', '-c', '3']
+        # nice es relativo al thread que lanza el proceso (puede tener nice de UART o background)
+        increment = nice - os.getpriority(os.PRIO_PROCESS, 0)
+        if increment and shutil.which('nice'):
+            prefix += ['nice', '-n', str(increment)]
+        if cpus and shutil.which('taskset'):
+            prefix += ['taskset', '-c', ','.join(str(cpu) for cpu in cpus)]
+        if os.sched_getscheduler(0) & ~getattr(os, 'SCHED_RESET_ON_FORK', 0) != os.SCHED_OTHER and shutil.which('chrt'):
+            prefix += ['chrt', '-o', '0']
+        return prefix + list(cmd)
+    
+    def report_process(self, role, pid):
+        """Registra la política efectiva de un proceso lanzado con prepare_command"""
+        if not self.enabled:
+            return
+        
+        report = {'pid': pid}
+        # Esperar a que el hijo haga exec y los envoltorios lleguen al comando real
+        with open('/proc/thread-self/comm') as f:
+            launcher = f.read().strip()
+        deadline = time.monotonic() + 1
+        while time.monotonic() < deadline:
+            try:
+                with open(f'/proc/{pid}/comm') as f:
+                    if f.read().strip() not in self.WRAPPERS + (launcher,):
+                        break
+            except OSError:
+                break
+            time.sleep(0.01)
+        try:
+            report['cpus'] = sorted(os.sched_getaffinity(pid))
+            report['policy'] = self._policy_name(os.sched_getscheduler(pid))
+            report['nice'] = os.getpriority(os.PRIO_PROCESS, pid)
+        except (OSError, ProcessLookupError) as e:
+            report['error'] = str(e)
+        if role == 'background':
+            report.update(self._read_ionice(pid))
+        self._record(role, report)
+    
+    @staticmethod
+    def _policy_name(policy):
+        policy &= ~getattr(os, 'SCHED_RESET_ON_FORK', 0)
+        names = {
+            os.SCHED_OTHER: 'other',
+            getattr(os, 'SCHED_FIFO', -1): 'fifo',
+            getattr(os, 'SCHED_RR', -1): 'rr',
+            getattr(os, 'SCHED_BATCH', -1): 'batch',
+            getattr(os, 'SCHED_IDLE', -1): 'idle',
+        }
+        return names.get(policy, str(policy))
+    
+    def get_metrics(self):
+        """Retorna la política efectiva de cada thread/proceso gestionado"""
+        with self.lock:
+            return {'enabled': self.enabled, 'cpus': self.all_cpus, **self.metrics}
+
+
+def run_scheduling_check(config):
+    """Aplica las políticas configuradas a procesos/threads de prueba y reporta
+
+    Sirve para verificar la configuración en cualquier Linux sin cámara ni UART.
+    """
+    scheduler = SchedulingManager(config)
+    scheduler.enabled = True
+    
+    for role in ('control', 'uart'):
+        thread = threading.Thread(target=scheduler.apply_to_current_thread,
+                                  args=(role,), name=f"Check-{role}")
+        thread.start()
+        thread.join()
+    
+    for role in ('recording', 'background'):
+        cmd = scheduler.prepare_command(role, ['sleep', '1'])
+        process = subprocess.Popen(cmd)
+        scheduler.report_process(role, process.pid)
+        process.wait()
+    
+    return scheduler.get_metrics()
+
+
+def _parse_size(value):
+    """Convierte '2M', '512K' o un número a bytes (o bytes/s; 0 = sin límite)"""
+    if not value:
+        return 0
+    if isinstance(value, (int, float)):
+        return int(value)
+    multipliers = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    value = str(value).strip().upper()
+    if value[-1] in multipliers:
+        return int(float(value[:-1]) * multipliers[value[-1]])
+    return int(value)
+
+
+def _file_sha256(path, block_size=1024 * 1024, length=None, consume=None, digest=None):
+    """Calcula el SHA-256 de un archivo sin llenar la caché de páginas
+
+    length limita la lectura a los primeros bytes; consume(n), si se indica,
+    se llama antes de cada bloque (límite de ancho de banda). Con digest se
+    continúa un hash ya empezado.
+    """
+    digest = digest or hashlib.sha256()
+    with open(path, 'rb') as f:
+        offset = 0
+        while length is None or offset < length:
+            size = block_size if length is None else min(block_size, length - offset)
+            if consume:
+                consume(size)
+            block = f.read(size)
+            if not block:
+                break
+            digest.update(block)
+            os.posix_fadvise(f.fileno(), offset, len(block), os.POSIX_FADV_DONTNEED)
+            offset += len(block)
+    return digest.hexdigest()
+
+
+class BandwidthLimiter:
+    """Limitador de ancho de banda compartido entre threads (token bucket)"""
+    
+    def __init__(self, rate):
+        self.rate = rate
+        self.available = rate
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def consume(self, nbytes):
+        """Bloquea el tiempo necesario para no superar self.rate bytes/s"""
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.available = min(self.rate, self.available + (now - self.last) * self.rate)
+            self.last = now
+            self.available -= nbytes
+            wait = -self.available / self.rate if self.available < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class OffloadManager:
+    """Cola de subida de grabaciones terminadas a un destino HTTP o de archivos
+
+    Los archivos se envían por bloques con reanudación tras una interrupción,
+    con límite de ancho de banda y de concurrencia, y se verifica el SHA-256
+    en el destino. Solo cuando la subida está confirmada se crea el marcador
+    local '<video>.uploaded', en el que puede confiar la limpieza.
+    
+    Protocolo HTTP (ver run_offload_server):
+    - HEAD <target>/<nombre>: 'Upload-Offset' con los bytes recibidos
+      (404 si no hay nada) y 'Upload-Checksum' cuando está completo
+    - PATCH <target>/<nombre>: bloque con 'Upload-Offset' y 'Upload-Length'
+    - DELETE <target>/<nombre>: descarta una subida corrupta
+    """
+    
+    BLOCK_SIZE = 64 * 1024
+    UPLOADED_SUFFIX = '.uploaded'
+    EXTENSIONS = ('.mp4', '.avi', '.mkv')
+    
+    def __init__(self, config, scheduler=None, is_recording=None):
+        options = config.get('offload', {})
+        self.target = options.get('target')
+        self.enabled = options.get('enabled', False) and bool(self.target)
+        self.is_http = str(self.target).startswith(('http://', 'https://'))
+        self.chunk_size = options.get('chunk_size', 4 * 1024 * 1024)
+        self.concurrency = options.get('concurrency', 1)
+        self.bandwidth = _parse_size(options.get('bandwidth_limit', '1M'))
+        # Durante una grabación se usa un límite menor para no competir por la SD
+        self.recording_bandwidth = _parse_size(
+            options.get('recording_bandwidth_limit', options.get('bandwidth_limit', '1M')))
+        self.retry_interval = options.get('retry_interval', 60)
+        self.video_path = config.get('storage', {}).get('video_path')
+        self.scheduler = scheduler or SchedulingManager(config)
+        self.is_recording = is_recording or (lambda: False)
+        self.limiter = BandwidthLimiter(self.bandwidth)
+        self.queue = queue.Queue()
+        self.queued = set()
+        self.active = {}
+        self.lock = threading.Lock()
+        self.threads = []
+        self.is_running = False
+        self.stats = {'uploaded': 0, 'failed': 0, 'resumed': 0, 'bytes_sent': 0}
+    
+    @classmethod
+    def is_uploaded(cls, path):
+        """True si el archivo ya fue subido y verificado en el destino"""
+        return Path(str(path) + cls.UPLOADED_SUFFIX).exists()
+    
+    def start(self):
+        """Lanza los workers de subida y encola grabaciones pendientes"""
+        if not self.enabled:
+            return
+        
+        self.is_running = True
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._worker, daemon=True, name=f"OffloadThread-{i}")
+            thread.start()
+            self.threads.append(thread)
+        
+        # Grabaciones terminadas de ejecuciones anteriores que no se subieron
+        if self.video_path and Path(self.video_path).is_dir():
+            for path in sorted(Path(self.video_path).iterdir()):
+                if path.suffix in self.EXTENSIONS:
+                    self.enqueue(path)
+        
+        logger.info(f"Offload iniciado hacia {self.target} "
+                    f"({self.concurrency} workers, {self.bandwidth} B/s)")
+    
+    def enqueue(self, path):
+        """Encola una grabación terminada para subirla"""
+        if not self.enabled or not self.is_running:
+            return False
+        
+        path = Path(path)
+        if self.is_uploaded(path) or not path.exists():
+            return False
+        
+        with self.lock:
+            if path in self.queued:
+                return False
+            self.queued.add(path)
+        self.queue.put(path)
+        logger.info(f"Offload: encolado {path}")
+        return True
+    
+    def _worker(self):
+        """Sube archivos de la cola con prioridad de segundo plano"""
+        self.scheduler.apply_to_current_thread('background')
+        
+        while self.is_running:
+            try:
+                path = self.queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            
+            try:
+                self._upload(path)
+            except Exception as e:
+                logger.error(f"Offload: error al subir {path}: {e}")
+                with self.lock:
+                    self.stats['failed'] += 1
+                # Reintentar más tarde (se reanuda desde lo ya recibido)
+                retry = threading.Timer(self.retry_interval, self.enqueue, args=(path,))
+                retry.daemon = True
+                retry.start()
+            finally:
+                with self.lock:
+                    self.queued.discard(path)
+                    self.active.pop(path, None)
+    
+    def _upload(self, path):
+        """Sube un archivo, verifica el checksum y lo marca como subido
+
+        El SHA-256 local se calcula con los mismos bloques que se envían; solo
+        la parte ya subida en un intento anterior se vuelve a leer, y con el
+        límite de ancho de banda, para no competir por la SD con la grabación.
+        """
+        size = path.stat().st_size
+        digest = hashlib.sha256()
+        
+        if self.is_http:
+            remote_checksum = self._upload_http(path, size, digest)
+        else:
+            remote_checksum = self._upload_filesystem(path, size, digest)
+        local_checksum = digest.hexdigest()
+        
+        if remote_checksum != local_checksum:
+            self._discard_remote(path)
+            raise Exception(f"checksum no coincide ({remote_checksum} != {local_checksum})")
+        
+        marker = Path(str(path) + self.UPLOADED_SUFFIX)
+        marker.write_text(json.dumps({
+            'target': self.target,
+            'sha256': local_checksum,
+            'size': size,
+            'uploaded_at': datetime.now().isoformat()
+        }))
+        with self.lock:
+            self.stats['uploaded'] += 1
+        logger.info(f"Offload: {path} subido y verificado")
+    
+    def _throttle(self, nbytes):
+        """Espera lo necesario para leer nbytes sin superar el límite vigente"""
+        self.limiter.rate = self.recording_bandwidth if self.is_recording() else self.bandwidth
+        self.limiter.consume(nbytes)
+    
+    def _hash_sent(self, path, offset, digest):
+        """Agrega al hash los bytes que el destino ya tenía (reanudación)"""
+        if offset:
+            _file_sha256(path, self.BLOCK_SIZE, length=offset, consume=self._throttle, digest=digest)
+    
+    def _read_blocks(self, path, offset, length, digest):
+        """Lee length bytes desde offset respetando el límite de ancho de banda
+
+        Cada bloque leído se agrega a digest.
+        """
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            os.posix_fadvise(f.fileno(), offset, length, os.POSIX_FADV_SEQUENTIAL)
+            remaining = length
+            while remaining > 0:
+                block = f.read(min(self.BLOCK_SIZE, remaining))
+                if not block:
+                    raise Exception(f"archivo truncado: {path}")
+                self._throttle(len(block))
+                digest.update(block)
+                # No desplazar de la caché las páginas de la grabación en curso
+                os.posix_fadvise(f.fileno(), offset, len(block), os.POSIX_FADV_DONTNEED)
+                offset += len(block)
+                remaining -= len(block)
+                with self.lock:
+                    self.stats['bytes_sent'] += len(block)
+                    self.active[path] = offset
+                yield block
+    
+    def _http_head(self, url):
+        """Retorna (offset, checksum) de la subida en el servidor"""
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, method='HEAD'), timeout=30) as response:
+                checksum = response.headers.get('Upload-Checksum', '')
+                return int(response.headers.get('Upload-Offset', 0)), checksum.replace('sha256 ', '') or None
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return 0, None
+            raise
+    
+    def _upload_http(self, path, size, digest):
+        url = f"{self.target.rstrip('/')}/{urllib.parse.quote(path.name)}"
+        offset, checksum = self._http_head(url)
+        if offset > size:
+            offset = 0
+        if 0 < offset:
+            logger.info(f"Offload: reanudando {path.name} desde {offset}/{size} bytes")
+            with self.lock:
+                self.stats['resumed'] += 1
+        self._hash_sent(path, offset, digest)
+        
+        while offset < size:
+            length = min(self.chunk_size, size - offset)
+            request = urllib.request.Request(
+                url,
+                data=self._read_blocks(path, offset, length, digest),
+                method='PATCH',
+                headers={
+                    'Content-Type': 'application/offset+octet-stream',
+                    'Content-Length': str(length),
+                    'Upload-Offset': str(offset),
+                    'Upload-Length': str(size),
+                }
+            )
+            with urllib.request.urlopen(request, timeout=60) as response:
+                received = int(response.headers['Upload-Offset'])
+            if received != offset + length:
+                # El hash local ya incluye el bloque completo: reintentar desde lo recibido
+                raise Exception(f"el servidor aceptó hasta {received}, se esperaba {offset + length}")
+            offset = received
+            # El checksum del HEAD inicial solo vale si el archivo ya estaba completo
+            checksum = None
+        
+        if checksum is None:
+            _, checksum = self._http_head(url)
+        if checksum is None:
+            raise Exception("el servidor no confirmó la subida")
+        return checksum
+    
+    def _upload_filesystem(self, path, size, digest):
+        target_dir = Path(self.target)
+        target_dir.mkdir(parents=True, exist_ok=True)
+        final = target_dir / path.name
+        partial = target_dir / (path.name + '.part')
+        
+        if final.exists() and final.stat().st_size == size:
+            self._hash_sent(path, size, digest)
+            return _file_sha256(final, self.BLOCK_SIZE, consume=self._throttle)
+        
+        offset = partial.stat().st_size if partial.exists() else 0
+        if offset > size:
+            offset = 0
+        if offset:
+            logger.info(f"Offload: reanudando {path.name} desde {offset}/{size} bytes")
+            with self.lock:
+                self.stats['resumed'] += 1
+        self._hash_sent(path, offset, digest)
+        
+        with open(partial, 'r+b' if offset else 'wb') as out:
+            out.seek(offset)
+            out.truncate()
+            while offset < size:
+                length = min(self.chunk_size, size - offset)
+                for block in self._read_blocks(path, offset, length, digest):
+                    out.write(block)
+                out.flush()
+                os.fsync(out.fileno())
+                offset += length
+        
+        os.replace(partial, final)
+        # Verificar lo escrito en el destino (no en la SD), también con el límite
+        return _file_sha256(final, self.BLOCK_SIZE, consume=self._throttle)
+    
+    def _discard_remote(self, path):
+        """Borra del destino una subida corrupta para empezar de cero"""
+        if self.is_http:
+            url = f"{self.target.rstrip('/')}/{urllib.parse.quote(path.name)}"
+            urllib.request.urlopen(urllib.request.Request(url, method='DELETE'), timeout=30).close()
+        else:
+            (Path(self.target) / path.name).unlink(missing_ok=True)
+    
+    def update_limits(self, config):
+        """Aplica en caliente los límites de ancho de banda y reintento"""
+        options = config.get('offload', {})
+        self.bandwidth = _parse_size(options.get('bandwidth_limit', '1M'))
+        self.recording_bandwidth = _parse_size(
+            options.get('recording_bandwidth_limit', options.get('bandwidth_limit', '1M')))
+        self.retry_interval = options.get('retry_interval', 60)
+    
+    def get_status(self):
+        """Retorna el estado de la cola de subida"""
+        with self.lock:
+            return {
+                'enabled': self.enabled,
+                'target': self.target,
+                'pending': self.queue.qsize(),
+                'active': {str(path): offset for path, offset in self.active.items()},
+                **self.stats
+            }
+    
+    def stop(self):
+        """Detiene los workers (las subidas incompletas se reanudan al reiniciar)"""
+        self.is_running = False
+        for thread in self.threads:
+            thread.join(timeout=2)
+        self.threads = []
+
+
+class _OffloadRequestHandler(BaseHTTPRequestHandler):
+    """Servidor de prueba para el protocolo de subida de OffloadManager"""
+    
+    directory = '.'
+    
+    def _paths(self):
+        name = os.path.basename(urllib.parse.unquote(self.path.split('?')[0]))
+        final = Path(self.directory) / name
+        return final, Path(str(final) + '.part')
+    
+    def do_HEAD(self):
+        final, partial = self._paths()
+        if final.exists():
+            self.send_response(200)
+            self.send_header('Upload-Offset', str(final.stat().st_size))
+            self.send_header('Upload-Checksum', f"sha256 {_file_sha256(final)}")
+        elif partial.exists():
+            self.send_response(200)
+            self.send_header('Upload-Offset', str(partial.stat().st_size))
+        else:
+            self.send_response(404)
+        self.end_headers()
+    
+    def do_PATCH(self):
+        final, partial = self._paths()
+        offset = int(self.headers['Upload-Offset'])
+        total = int(self.headers['Upload-Length'])
+        length = int(self.headers['Content-Length'])
+        current = partial.stat().st_size if partial.exists() else 0
+        
+        if offset not in (0, current):
+            self.send_response(409)
+            self.send_header('Upload-Offset', str(current))
+            self.end_headers()
+            return
+        
+        with open(partial, 'r+b' if offset else 'wb') as out:
+            out.seek(offset)
+            out.truncate()
+            remaining = length
+            while remaining > 0:
+                block = self.rfile.read(min(65536, remaining))
+                if not block:
+                    break
+                out.write(block)
+                remaining -= len(block)
+            out.flush()
+            os.fsync(out.fileno())
+            offset = out.tell()
+        
+        self.send_response(204)
+        self.send_header('Upload-Offset', str(offset))
+        if offset == total:
+            os.replace(partial, final)
+            self.send_header('Upload-Checksum', f"sha256 {_file_sha256(final)}")
+        self.end_headers()
+    
+    def do_DELETE(self):
+        for path in self._paths():
+            if path.exists():
+                path.unlink()
+        self.send_response(204)
+        self.end_headers()
+    
+    def log_message(self, format, *args):
+        logger.debug(f"Offload server: {format % args}")
+
+
+def run_offload_server(directory, port=8000):
+    """Servidor HTTP local que recibe subidas (sustituto del servidor real)"""
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    handler = type('OffloadHandler', (_OffloadRequestHandler,), {'directory': str(directory)})
+    server = ThreadingHTTPServer(('', port), handler)
+    logger.info(f"Servidor de offload en puerto {port}, guardando en {directory}")
+    return server
+
+
 class CameraController:
     """Controla la cámara USB y gestiona grabación de video"""
     
-    def __init__(self, config):
+    def __init__(self, config, scheduler=None, offload=None):
         self.config = config
+        self.scheduler = scheduler or SchedulingManager(config)
+        self.offload = offload
         self.camera = None
         self.is_recording = False
+        # Serializa start/stop: ahora pueden llegar desde jobs, la cola de cámara y el cleanup
+        self.recording_lock = threading.Lock()
         self.video_writer = None
+        # Protege el cambio de VideoWriter (roll) frente al thread de captura
+        self.writer_lock = threading.Lock()
         self.ffmpeg_process = None
         self.current_filename = None
         self.frame_queue = queue.Queue(maxsize=30)
         self.command_queue = queue.Queue()
         self.use_hardware_encoder = config.get('use_hardware_encoder', True)
+        # Pipeline multiproceso (solo aplica al modo software encoder)
+        self.use_pipeline = (not self.use_hardware_encoder and
+                             config.get('pipeline', {}).get('enabled', False))
+        self.pipeline = None
+        # Timelapse adaptativo (solo modo use_mjpeg_raw)
+        self.use_timelapse = config.get('timelapse', {}).get('enabled', False)
+        self.timelapse = None
+        self.last_timelapse_report = None
+        # Staging en RAM: archivos de grabaciones cerradas que aún se están finalizando
+        self.staging = StagingManager(config, self)
+        self.closing_files = set()
+        self.spilled = False
         
     def initialize_camera(self):
         """Inicializa la cámara USB"""
@@ -58,6 +1170,13 @@ class CameraController:
                 logger.info(f"Cámara USB detectada: {device_path} (hardware encoding)")
                 return True
             
+            # Pipeline multiproceso: el proceso de captura abre la cámara
+            if self.use_pipeline:
+                self.pipeline = FramePipeline(self.config)
+                self.pipeline.start()
+                logger.info("Cámara USB gestionada por el pipeline multiproceso")
+                return True
+            
             # Si usa software encoder, abrir con OpenCV
             self.camera = cv2.VideoCapture(self.config['camera']['device_id'])
             
@@ -81,33 +1200,71 @@ class CameraController:
     
     def start_recording(self):
         """Inicia la grabación de video con hardware H.264 encoder"""
-        if self.is_recording:
-            logger.warning("Ya se está grabando")
-            return False
+        with self.recording_lock:
+            if self.is_recording:
+                logger.warning("Ya se está grabando")
+                return False
             
-        try:
-            # Crear directorio de videos si no existe
-            video_dir = Path(self.config['storage']['video_path'])
-            video_dir.mkdir(parents=True, exist_ok=True)
+            try:
+                # Directorio de videos (o staging en RAM si está habilitado)
+                self.spilled = False
+                video_dir = self._recording_dir()
             
-            # Generar nombre de archivo con timestamp
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            self.current_filename = video_dir / f"video_{timestamp}.h264"
+                # Generar nombre de archivo con timestamp
+                self.current_filename = self._new_filename(video_dir)
             
-            if self.use_hardware_encoder:
-                # Usar hardware encoder con FFmpeg y V4L2
-                self._start_hardware_recording()
-            else:
-                # Fallback a software encoder
-                self._start_software_recording()
+                if self.use_hardware_encoder:
+                    # Usar hardware encoder con FFmpeg y V4L2
+                    self._start_hardware_recording()
+                else:
+                    # Fallback a software encoder
+                    self._start_software_recording()
             
-            self.is_recording = True
-            logger.info(f"Grabación iniciada (H.264 hardware): {self.current_filename}")
-            return True
+                self.is_recording = True
+                logger.info(f"Grabación iniciada (H.264 hardware): {self.current_filename}")
+                return True
             
-        except Exception as e:
-            logger.error(f"Error al iniciar grabación: {e}")
-            return False
+            except Exception as e:
+                logger.error(f"Error al iniciar grabación: {e}")
+                return False
+    
+    def recording_mode(self):
+        """Modo de grabación según la configuración
+
+        'software', 'mjpeg' (modo 1), 'timelapse' (modo 1 con timelapse),
+        'camera_h264' (modo 2), 'encoder' (modo 3, hardware encoder de la Pi)
+        o 'timelapse_encoder' (modo 3 con timelapse).
+        """
+        if not self.use_hardware_encoder:
+            return 'software'
+        if self.config.get('use_mjpeg_raw', False):
+            return 'timelapse' if self.use_timelapse else 'mjpeg'
+        if self.config.get('use_camera_h264', False):
+            return 'camera_h264'
+        return 'timelapse_encoder' if self.use_timelapse else 'encoder'
+    
+    def _recording_dir(self):
+        """Directorio de la próxima grabación: staging en RAM si hay espacio, si no la SD"""
+        if not self.spilled and self.staging.has_room():
+            return self.staging.path
+        video_dir = Path(self.config['storage']['video_path'])
+        video_dir.mkdir(parents=True, exist_ok=True)
+        return video_dir
+    
+    def _new_filename(self, video_dir):
+        """Nombre con timestamp; agrega sufijo si ya existe (roll en el mismo segundo)
+
+        Se revisan la SD y el staging: un archivo en RAM termina en la SD con
+        el mismo nombre.
+        """
+        directories = {video_dir, self.staging.path, Path(self.config['storage']['video_path'])}
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        stem = f"video_{timestamp}"
+        index = 1
+        while any(any(directory.glob(f"{stem}.*")) for directory in directories):
+            stem = f"video_{timestamp}_{index}"
+            index += 1
+        return video_dir / f"{stem}.h264"
     
     def _start_hardware_recording(self):
         """Inicia grabación usando stream directo de la cámara o hardware encoder"""
@@ -118,6 +1275,16 @@ class CameraController:
         use_camera_h264 = self.config.get('use_camera_h264', False)
         use_mjpeg_raw = self.config.get('use_mjpeg_raw', False)
         
+        if self.use_timelapse:
+            if not use_camera_h264 or use_mjpeg_raw:
+                # Modo 1b / 3b: fps adaptativo (Matroska, fps variable); en modo 3
+                # se codifican con el hardware encoder solo los frames elegidos
+                self.current_filename = Path(str(self.current_filename).replace('.h264', '.mkv'))
+                self.timelapse = AdaptiveTimelapse(self.config, self.scheduler, encode=not use_mjpeg_raw)
+                self.timelapse.start(self.current_filename)
+                return
+            logger.warning("Timelapse adaptativo no aplica con use_camera_h264, grabando a fps completo")
+        
         if use_mjpeg_raw:
             # Modo 1: MJPEG raw de la cámara (CPU ~2%, archivos grandes)
             # Guarda MJPEG directamente sin re-encoding
@@ -132,6 +1299,7 @@ class CameraController:
                 '-f', 'avi',  # AVI soporta MJPEG nativo
                 str(self.current_filename).replace('.h264', '.avi')
             ]
+            self.current_filename = Path(ffmpeg_cmd[-1])
             logger.info("Usando MJPEG raw de la cámara (sin encoding, archivos grandes)")
         elif use_camera_h264:
             # Modo 2: Copiar stream H.264 directo de la cámara (CPU ~2%)
@@ -148,6 +1316,7 @@ class CameraController:
                 '-movflags', '+faststart',
                 str(self.current_filename).replace('.h264', '.mp4')
             ]
+            self.current_filename = Path(ffmpeg_cmd[-1])
             logger.info("Usando H.264 nativo de la cámara (stream copy)")
         else:
             # Modo 3: Hardware encoder de la Pi (CPU ~10-15%)
@@ -170,15 +1339,21 @@ class CameraController:
             ]
             logger.info("Usando hardware encoder de la Raspberry Pi")
         
+        if self.staging.is_staged(self.current_filename):
+            # En RAM se graba en segmentos para poder volcarlos a la SD mientras sigue
+            ffmpeg_cmd = self.staging.segment_command(ffmpeg_cmd)
+        
         logger.info(f"Comando FFmpeg: {' '.join(ffmpeg_cmd)}")
         
-        # Iniciar proceso FFmpeg
+        # Iniciar proceso FFmpeg (con afinidad/prioridad del rol 'recording')
+        ffmpeg_cmd = self.scheduler.prepare_command('recording', ffmpeg_cmd)
         self.ffmpeg_process = subprocess.Popen(
             ffmpeg_cmd,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             stdin=subprocess.PIPE
         )
+        self.scheduler.report_process('recording', self.ffmpeg_process.pid)
         
         logger.info("Hardware encoder H.264 iniciado")
     
@@ -188,55 +1363,197 @@ class CameraController:
         fps = self.config['camera']['fps']
         frame_size = (self.config['camera']['width'], self.config['camera']['height'])
         
-        self.video_writer = cv2.VideoWriter(
+        video_writer = cv2.VideoWriter(
             str(self.current_filename),
             fourcc,
             fps,
             frame_size
         )
         
-        if not self.video_writer.isOpened():
+        if not video_writer.isOpened():
             raise Exception("No se pudo crear el archivo de video")
+        
+        with self.writer_lock:
+            self.video_writer = video_writer
     
-    def stop_recording(self):
-        """Detiene la grabación de video"""
-        if not self.is_recording:
-            return False
+    def stop_recording(self, progress=None):
+        """Detiene la grabación de video
+
+        progress(etapa) se llama al avanzar ('stopping_encoder', 'remuxing')
+        para que los jobs asíncronos puedan informar el avance.
+        """
+        with self.recording_lock:
+            if not self.is_recording:
+                return False
+            
+            self.is_recording = False
+            if progress:
+                progress('stopping_encoder')
+        
+            # Detener timelapse adaptativo (ambos FFmpeg)
+            if self.timelapse:
+                self.last_timelapse_report = self.timelapse.stop()
+                self.timelapse = None
+        
+            # Detener hardware encoder (FFmpeg)
+            if self.ffmpeg_process:
+                self._stop_hardware_recording()
+        
+            # Detener software encoder
+            with self.writer_lock:
+                if self.video_writer:
+                    self.video_writer.release()
+                    self.video_writer = None
+            
+            logger.info(f"Grabación finalizada: {self.current_filename}")
+            
+            if self.staging.is_staged(self.current_filename):
+                # El volcado a la SD convierte y encola para subir cada segmento
+                return True
+        
+            # Convertir .h264 a .mp4 para compatibilidad
+            if str(self.current_filename).endswith('.h264'):
+                if progress:
+                    progress('remuxing')
+                self.current_filename = self._convert_to_mp4(self.current_filename)
+        
+            # Encolar la grabación terminada para subirla
+            if self.offload:
+                self.offload.enqueue(self.current_filename)
+            
+            return True
+    
+    def _stop_hardware_recording(self):
+        """Detiene el proceso FFmpeg de grabación"""
+        try:
+            # Enviar señal de terminación suave
+            self.ffmpeg_process.stdin.write(b'q')
+            self.ffmpeg_process.stdin.flush()
+            self.ffmpeg_process.wait(timeout=5)
+        except:
+            # Forzar terminación si no responde
+            self.ffmpeg_process.terminate()
+            self.ffmpeg_process.wait(timeout=2)
+        finally:
+            self.ffmpeg_process = None
+            logger.info(f"Hardware encoder detenido")
+    
+    def roll_recording(self):
+        """Continúa la grabación en curso en un archivo nuevo
+
+        Se usa al recargar la configuración (bitrate, ruta de videos). En modo
+        software y timelapse solo se cambia el destino entre dos frames, sin
+        hueco. En los modos FFmpeg directos la cámara V4L2 no admite dos
+        lectores, así que el FFmpeg nuevo arranca apenas el anterior suelta el
+        dispositivo; el remux y la subida del archivo anterior se hacen después,
+        en segundo plano, para que el hueco sea mínimo.
+        """
+        with self.recording_lock:
+            if not self.is_recording:
+                return False
             
-        self.is_recording = False
-        
-        # Detener hardware encoder (FFmpeg)
-        if self.ffmpeg_process:
+            previous = self.current_filename
+            old_writer = old_process = None
+            if self.staging.is_staged(previous):
+                self.closing_files.add(previous)
             try:
-                # Enviar señal de terminación suave
-                self.ffmpeg_process.stdin.write(b'q')
-                self.ffmpeg_process.stdin.flush()
-                self.ffmpeg_process.wait(timeout=5)
-            except:
-                # Forzar terminación si no responde
-                self.ffmpeg_process.terminate()
-                self.ffmpeg_process.wait(timeout=2)
-            finally:
-                self.ffmpeg_process = None
-                logger.info(f"Hardware encoder detenido")
-        
-        # Detener software encoder
-        if self.video_writer:
-            self.video_writer.release()
-            self.video_writer = None
-            
-        logger.info(f"Grabación finalizada: {self.current_filename}")
+                video_dir = self._recording_dir()
+                self.current_filename = self._new_filename(video_dir)
+                
+                if self.timelapse:
+                    self.current_filename = self.current_filename.with_suffix('.mkv')
+                    old_process, self.last_timelapse_report = self.timelapse.roll(self.current_filename)
+                elif self.video_writer:
+                    old_writer = self.video_writer
+                    self._start_software_recording()
+                else:
+                    self._stop_hardware_recording()
+                    self._start_hardware_recording()
+            except Exception as e:
+                logger.error(f"Error al cambiar de archivo de grabación, grabación detenida: {e}")
+                self.is_recording = False
+                self.current_filename = previous
+                # Cerrar lo que quedó abierto; el archivo anterior se finaliza abajo
+                if self.timelapse:
+                    self.last_timelapse_report = self.timelapse.stop()
+                    self.timelapse = None
+                if self.ffmpeg_process:
+                    self._stop_hardware_recording()
+                with self.writer_lock:
+                    if self.video_writer:
+                        old_writer = self.video_writer
+                        self.video_writer = None
+            else:
+                logger.info(f"Grabación continúa en {self.current_filename} (anterior: {previous})")
         
-        # Convertir .h264 a .mp4 para compatibilidad
-        if str(self.current_filename).endswith('.h264'):
-            self._convert_to_mp4()
+        threading.Thread(
+            target=self._finalize_recording,
+            args=(previous, old_writer, old_process),
+            daemon=True,
+            name="FinalizeThread"
+        ).start()
+        return self.is_recording
+    
+    def _finalize_recording(self, filename, writer=None, process=None):
+        """Cierra, convierte y encola un archivo que quedó atrás tras un roll"""
+        if writer:
+            writer.release()
+        if process:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.terminate()
+        if filename in self.closing_files:
+            # Archivo en RAM: el volcado a la SD se encarga del resto
+            self.closing_files.discard(filename)
+            return
+        if str(filename).endswith('.h264'):
+            filename = self._convert_to_mp4(filename)
+        if self.offload:
+            self.offload.enqueue(filename)
+    
+    def active_files(self):
+        """Archivos del staging que todavía se están escribiendo o cerrando"""
+        with self.recording_lock:
+            recordings = set(self.closing_files)
+            current = self.current_filename
+            if self.is_recording and current:
+                recordings.add(current)
             
-        return True
+            files = set()
+            for recording in recordings:
+                files.add(recording)
+                # Segmentos del muxer de FFmpeg: de un archivo cerrándose, todos;
+                # de la grabación en curso, el último (el que FFmpeg tiene abierto)
+                segments = self.staging.segments(recording)
+                if recording in self.closing_files:
+                    files.update(segments)
+                elif segments:
+                    files.add(segments[-1])
+            return files
+    
+    def check_staged_segment(self, max_bytes):
+        """Cambia de archivo cuando la grabación en RAM (software/timelapse) llega a max_bytes"""
+        current = self.current_filename
+        if not self.is_recording or self.ffmpeg_process or not self.staging.is_staged(current):
+            return
+        try:
+            size = current.stat().st_size
+        except FileNotFoundError:
+            return
+        if size >= max_bytes:
+            self.roll_recording()
     
-    def _convert_to_mp4(self):
-        """Convierte archivo H.264 raw a MP4 container"""
+    def spill_to_card(self):
+        """Backpressure del staging: la grabación en curso sigue directo en la SD"""
+        if not self.is_recording or not self.staging.is_staged(self.current_filename):
+            return False
+        self.spilled = True
+        return self.roll_recording()
+    
+    def _convert_to_mp4(self, h264_file):
+        """Convierte archivo H.264 raw a MP4 container; retorna el archivo resultante"""
         try:
-            h264_file = self.current_filename
             mp4_file = str(h264_file).replace('.h264', '.mp4')
             
             # Conversión rápida sin re-encoding
@@ -249,27 +1566,40 @@ class CameraController:
                 mp4_file
             ]
             
-            result = subprocess.run(
+            # Remux en segundo plano: CPU e I/O idle para no competir con la grabación
+            convert_cmd = self.scheduler.prepare_command('background', convert_cmd)
+            with subprocess.Popen(
                 convert_cmd,
                 stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                timeout=30
-            )
+                stderr=subprocess.PIPE
+            ) as process:
+                self.scheduler.report_process('background', process.pid)
+                try:
+                    _, stderr = process.communicate(timeout=30)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.communicate()
+                    raise
             
-            if result.returncode == 0:
+            if process.returncode == 0:
                 # Eliminar archivo H.264 original
                 os.remove(h264_file)
-                self.current_filename = Path(mp4_file)
                 logger.info(f"Convertido a MP4: {mp4_file}")
+                return Path(mp4_file)
             else:
-                logger.warning(f"No se pudo convertir a MP4: {result.stderr.decode()}")
+                logger.warning(f"No se pudo convertir a MP4: {stderr.decode()}")
+                # No dejar un MP4 a medias junto al H.264 original
+                if os.path.exists(mp4_file):
+                    os.remove(mp4_file)
                 
         except Exception as e:
             logger.error(f"Error en conversión a MP4: {e}")
+        return Path(h264_file)
     
     def capture_frames(self):
         """Captura frames de la cámara continuamente"""
         logger.info("Iniciando captura de frames")
+        self.scheduler.apply_to_current_thread('control')
         
         while True:
             # Cuando usa hardware encoder, FFmpeg captura directamente
@@ -286,6 +1616,11 @@ class CameraController:
                 time.sleep(0.1)  # Pausa más larga cuando usa hardware
                 continue
             
+            # Modo pipeline: los frames llegan procesados desde la memoria compartida
+            if self.pipeline:
+                self._consume_pipeline_frame()
+                continue
+            
             # Modo software encoder: capturar frames con OpenCV
             if self.camera is None or not self.camera.isOpened():
                 logger.error("Cámara no disponible")
@@ -299,11 +1634,12 @@ class CameraController:
                 continue
             
             # Si está grabando con software encoder, escribir frame
-            if self.is_recording and self.video_writer:
-                try:
-                    self.video_writer.write(frame)
-                except Exception as e:
-                    logger.error(f"Error al escribir frame: {e}")
+            with self.writer_lock:
+                if self.is_recording and self.video_writer:
+                    try:
+                        self.video_writer.write(frame)
+                    except Exception as e:
+                        logger.error(f"Error al escribir frame: {e}")
             
             # Procesar comandos de la cola
             try:
@@ -316,6 +1652,34 @@ class CameraController:
             # Pequeña pausa para no saturar CPU
             time.sleep(0.001)
     
+    def _consume_pipeline_frame(self):
+        """Escribe el siguiente frame del pipeline y procesa comandos"""
+        item = self.pipeline.next_frame(timeout=0.1)
+        if item is not None:
+            slot, frame = item
+            try:
+                with self.writer_lock:
+                    if self.is_recording and self.video_writer:
+                        self.video_writer.write(frame)
+            except Exception as e:
+                logger.error(f"Error al escribir frame: {e}")
+            finally:
+                self.pipeline.release(slot)
+        
+        try:
+            while not self.command_queue.empty():
+                cmd = self.command_queue.get_nowait()
+                self.process_camera_command(cmd)
+        except queue.Empty:
+            pass
+    
+    def _set_camera_property(self, prop, value):
+        """Ajusta una propiedad de la cámara, directa o vía pipeline"""
+        if self.pipeline:
+            self.pipeline.set_camera_property(prop, value)
+        else:
+            self.camera.set(prop, value)
+    
     def process_camera_command(self, command):
         """Procesa comandos para la cámara (zoom, etc)"""
         try:
@@ -324,17 +1688,17 @@ class CameraController:
             if cmd_type == 'zoom':
                 zoom_level = command.get('value', 1.0)
                 # Configurar zoom si la cámara lo soporta
-                self.camera.set(cv2.CAP_PROP_ZOOM, zoom_level)
+                self._set_camera_property(cv2.CAP_PROP_ZOOM, zoom_level)
                 logger.info(f"Zoom ajustado a: {zoom_level}")
                 
             elif cmd_type == 'focus':
                 focus_value = command.get('value', 0)
-                self.camera.set(cv2.CAP_PROP_FOCUS, focus_value)
+                self._set_camera_property(cv2.CAP_PROP_FOCUS, focus_value)
                 logger.info(f"Focus ajustado a: {focus_value}")
                 
             elif cmd_type == 'brightness':
                 brightness = command.get('value', 128)
-                self.camera.set(cv2.CAP_PROP_BRIGHTNESS, brightness)
+                self._set_camera_property(cv2.CAP_PROP_BRIGHTNESS, brightness)
                 logger.info(f"Brillo ajustado a: {brightness}")
                 
             elif cmd_type == 'start_record':
@@ -357,20 +1721,866 @@ class CameraController:
         """Limpia recursos de la cámara"""
         logger.info("Limpiando recursos de cámara")
         self.stop_recording()
+        self.staging.stop()
+        
+        if self.pipeline:
+            self.pipeline.stop()
+            self.pipeline = None
         
         if self.camera:
             self.camera.release()
             self.camera = None
 
 
+class LatencyHistogram:
+    """Histograma de latencias de escritura por rangos en milisegundos"""
+    
+    BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+    
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+    
+    def record(self, seconds):
+        ms = seconds * 1000
+        index = next((i for i, limit in enumerate(self.BUCKETS_MS) if ms <= limit), len(self.BUCKETS_MS))
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += ms
+            self.max = max(self.max, ms)
+    
+    def to_dict(self):
+        with self.lock:
+            buckets = {f"<={limit}ms": n for limit, n in zip(self.BUCKETS_MS, self.counts)}
+            buckets[f">{self.BUCKETS_MS[-1]}ms"] = self.counts[-1]
+            return {
+                'count': self.count,
+                'avg_ms': round(self.total / self.count, 3) if self.count else None,
+                'max_ms': round(self.max, 3),
+                'buckets': buckets,
+            }
+
+
+class StagingManager:
+    """Escritura en RAM (tmpfs) con volcado secuencial a la tarjeta SD
+
+    La grabación activa se escribe en staging.path (tmpfs) en segmentos: los
+    modos FFmpeg directos usan el muxer 'segment' de FFmpeg y los modos
+    software/timelapse cambian de archivo sin hueco (roll) al llegar a
+    max_bytes / 4. Un thread copia los segmentos terminados a
+    storage.video_path en bloques grandes, con fsync según la política
+    ('block', 'file' o 'none'), y los borra de la RAM.
+    
+    Si la SD no da abasto y el staging pasa de high_watermark × max_bytes, la
+    grabación en curso pasa a escribir directo en la SD (spill) hasta la
+    siguiente grabación.
+    """
+    
+    STALL_SECONDS = 1.0
+    # Estimación de bitrate cuando no se fija staging.stream_bitrate (bits por píxel)
+    MJPEG_BITS_PER_PIXEL = 1.5
+    CAMERA_H264_BITS_PER_PIXEL = 0.1
+    # Margen para picos del encoder sobre el bitrate esperado
+    BITRATE_MARGIN = 1.25
+    # Segmentos más cortos generan demasiados archivos y volcados
+    MIN_SEGMENT_SECONDS = 1.0
+    # El tmpfs cuenta en el límite de memoria del servicio (MemoryMax): el
+    # resto queda para FFmpeg, OpenCV y el anillo del pipeline
+    MEMORY_SHARE = 0.25
+    # Tope del apagado, por debajo del TimeoutStopSec de systemd (90 s)
+    STOP_TIMEOUT = 30
+    
+    def __init__(self, config, camera_controller=None):
+        options = config.get('staging', {})
+        self.config = config
+        self.camera_controller = camera_controller
+        self.enabled = options.get('enabled', False)
+        self.path = Path(options.get('path', '/dev/shm/camera_staging'))
+        self.max_bytes = _parse_size(options.get('max_bytes', '128M'))
+        self.block_size = _parse_size(options.get('flush_block', '4M'))
+        self.fsync_policy = options.get('fsync', 'file')
+        self.high_watermark = options.get('high_watermark', 0.75)
+        self.segment_bytes = self.max_bytes // 4
+        self.histogram = LatencyHistogram()
+        self.stats = {'flushed_files': 0, 'flushed_bytes': 0, 'spills': 0, 'stalls': 0}
+        self.threads = []
+        # flushing: archivo que copia el thread de volcado; el lock evita que
+        # el volcado final de stop() tome el mismo archivo
+        self.flushing = None
+        self.flush_lock = threading.Lock()
+        self.is_running = False
+    
+    @staticmethod
+    def memory_limit():
+        """Límite de memoria del proceso: el menor memory.max de su cgroup (v2)
+        y sus padres, o la RAM total si no hay límite"""
+        limits = []
+        try:
+            with open('/proc/self/cgroup') as f:
+                group = next(line.split(':', 2)[2].strip() for line in f if line.startswith('0::'))
+            path = Path('/sys/fs/cgroup' + group)
+            for directory in (path, *path.parents):
+                value = (directory / 'memory.max').read_text().strip()
+                if value != 'max':
+                    limits.append(int(value))
+        except (OSError, StopIteration, ValueError):
+            pass
+        try:
+            with open('/proc/meminfo') as f:
+                limits.append(next(int(line.split()[1]) * 1024 for line in f if line.startswith('MemTotal:')))
+        except (OSError, StopIteration, ValueError):
+            pass
+        return min(limits) if limits else None
+    
+    def start(self):
+        """Crea el directorio de staging y lanza los threads de volcado y de vigilancia"""
+        if not self.enabled:
+            return
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.is_running = True
+        # Vigilancia aparte: si la SD se traba, el thread de volcado queda
+        # bloqueado en write() y no podría aplicar el backpressure
+        self.threads = [
+            threading.Thread(target=self._flush_loop, daemon=True, name="StagingFlushThread"),
+            threading.Thread(target=self._watch_loop, daemon=True, name="StagingWatchThread"),
+        ]
+        for thread in self.threads:
+            thread.start()
+        logger.info(f"Staging en RAM: {self.path} ({self.max_bytes / 1e6:.0f} MB, fsync '{self.fsync_policy}')")
+    
+    def used_bytes(self):
+        """Bytes ocupados en el staging"""
+        try:
+            return sum(entry.stat().st_size for entry in os.scandir(self.path) if entry.is_file())
+        except FileNotFoundError:
+            return 0
+    
+    def has_room(self):
+        """True si una grabación nueva puede ir al staging"""
+        return self.is_running and self.used_bytes() < self.max_bytes * self.high_watermark
+    
+    def is_staged(self, path):
+        return path is not None and Path(path).parent == self.path
+    
+    @staticmethod
+    def segments(recording):
+        """Segmentos de FFmpeg de una grabación, ordenados por índice
+
+        Orden numérico: el patrón %03d pasa de _999 a _1000 y el orden
+        alfabético dejaría de señalar el segmento abierto.
+        """
+        pattern = re.compile(rf"{re.escape(recording.stem)}_(\d{{3,}}){re.escape(recording.suffix)}")
+        try:
+            names = os.listdir(recording.parent)
+        except FileNotFoundError:
+            return []
+        found = ((int(match.group(1)), name) for name in names if (match := pattern.fullmatch(name)))
+        return [recording.parent / name for _, name in sorted(found)]
+    
+    @classmethod
+    def segment_plan(cls, config):
+        """Duración de segmento en los modos FFmpeg directos
+
+        El muxer 'segment' corta por tiempo (en el primer keyframe después de
+        segment_time), no por tamaño. La duración se deriva del bitrate
+        esperado para que cada segmento quepa en max_bytes / 4 aun con un GOP
+        de más. Retorna (segundos, bytes_por_segundo, keyframe_segundos);
+        segundos < MIN_SEGMENT_SECONDS significa que el presupuesto no alcanza.
+        """
+        options = config.get('staging', {})
+        camera = {**CameraSystem.get_default_config()['camera'], **config.get('camera', {})}
+        pixels_per_second = camera['width'] * camera['height'] * camera['fps']
+        if config.get('use_mjpeg_raw', False):
+            bits = pixels_per_second * cls.MJPEG_BITS_PER_PIXEL
+            keyframe = 1 / camera['fps']
+        elif config.get('use_camera_h264', False):
+            bits = pixels_per_second * cls.CAMERA_H264_BITS_PER_PIXEL
+            keyframe = 2.0
+        else:
+            # Modo 3: '-b:v bitrate' y '-g fps * 2'
+            bits = _parse_size(config.get('bitrate', '4M'))
+            keyframe = 2.0
+        if options.get('stream_bitrate'):
+            bits = _parse_size(options['stream_bitrate'])
+        
+        bytes_per_second = bits / 8 * cls.BITRATE_MARGIN
+        segment_bytes = _parse_size(options.get('max_bytes', '128M')) // 4
+        seconds = min(options.get('segment_seconds', 10), segment_bytes / bytes_per_second - keyframe)
+        return seconds, bytes_per_second, keyframe
+    
+    def segment_command(self, ffmpeg_cmd):
+        """Convierte la salida de un comando FFmpeg en segmentos que caben en el presupuesto"""
+        seconds, bytes_per_second, _ = self.segment_plan(self.config)
+        seconds = max(seconds, self.MIN_SEGMENT_SECONDS)
+        logger.info(f"Staging: segmentos de {seconds:.1f} s (~{bytes_per_second / 1e6:.1f} MB/s esperados)")
+        index = len(ffmpeg_cmd) - 1 - ffmpeg_cmd[::-1].index('-f')
+        output_format, filename = ffmpeg_cmd[index + 1], Path(ffmpeg_cmd[-1])
+        cmd = ffmpeg_cmd[:index]
+        format_options = []
+        extra = ffmpeg_cmd[index + 2:-1]
+        while extra:
+            # Opciones del muxer (ej. -movflags) pasan al muxer de cada segmento
+            option, value, extra = extra[0], extra[1], extra[2:]
+            format_options.append(f"{option.lstrip('-')}={value}")
+        if output_format == 'h264':
+            # Sin esto solo el primer segmento lleva SPS/PPS y el resto no se puede remuxear
+            cmd += ['-bsf:v', 'dump_extra']
+        cmd += [
+            '-f', 'segment',
+            '-segment_format', output_format,
+            '-segment_time', f"{seconds:.2f}",
+            '-reset_timestamps', '1',
+        ]
+        if format_options:
+            cmd += ['-segment_format_options', ':'.join(format_options)]
+        return cmd + [str(filename.with_name(f"{filename.stem}_%03d{filename.suffix}"))]
+    
+    def _flush_loop(self):
+        """Vuelca a la SD los segmentos terminados, del más antiguo al más nuevo"""
+        while self.is_running:
+            try:
+                for path in self._finished_files():
+                    with self.flush_lock:
+                        if not self.is_running:
+                            break
+                        self.flushing = path
+                    try:
+                        self.flush_file(path)
+                    finally:
+                        self.flushing = None
+            except Exception as e:
+                logger.error(f"Error en volcado de staging: {e}")
+            time.sleep(0.5)
+    
+    def _watch_loop(self):
+        """Corta segmentos por tamaño y aplica backpressure si el staging se llena"""
+        controller = self.camera_controller
+        while self.is_running and controller:
+            try:
+                controller.check_staged_segment(self.segment_bytes)
+                
+                # La SD no da abasto: la grabación sigue directo en ella
+                used = self.used_bytes()
+                if used > self.max_bytes * self.high_watermark and controller.spill_to_card():
+                    self.stats['spills'] += 1
+                    logger.warning(f"Staging lleno ({used / 1e6:.0f} MB): grabando directo en la SD")
+            except Exception as e:
+                logger.error(f"Error en vigilancia de staging: {e}")
+            time.sleep(0.5)
+    
+    def _finished_files(self, include_active=False):
+        """Archivos del staging que ya no se están escribiendo, del más antiguo al más nuevo"""
+        try:
+            entries = [Path(entry.path) for entry in os.scandir(self.path) if entry.is_file()]
+        except FileNotFoundError:
+            return []
+        # Se consulta después de listar: un segmento creado entre medio no aparece
+        # en la lista, así que nunca se vuelca uno que FFmpeg acaba de abrir
+        active = set()
+        if self.camera_controller and not include_active:
+            active = self.camera_controller.active_files()
+        return sorted((path for path in entries if path not in active), key=lambda p: p.stat().st_mtime)
+    
+    def flush_file(self, path, dest_dir=None):
+        """Copia un archivo del staging a la SD en bloques grandes y lo borra de la RAM"""
+        controller = self.camera_controller
+        if controller and path.suffix == '.h264':
+            # Remux en RAM: a la SD solo se escribe el MP4 final
+            path = controller._convert_to_mp4(path)
+        
+        dest_dir = Path(dest_dir or self.config['storage']['video_path'])
+        dest_dir.mkdir(parents=True, exist_ok=True)
+        dest = dest_dir / path.name
+        partial = dest_dir / (path.name + '.part')
+        size = path.stat().st_size
+        
+        with open(path, 'rb') as src, open(partial, 'wb') as out:
+            if size:
+                os.posix_fallocate(out.fileno(), 0, size)
+            while True:
+                block = src.read(self.block_size)
+                if not block:
+                    break
+                start = time.monotonic()
+                out.write(block)
+                out.flush()
+                if self.fsync_policy == 'block':
+                    os.fsync(out.fileno())
+                elapsed = time.monotonic() - start
+                self.histogram.record(elapsed)
+                if elapsed > self.STALL_SECONDS:
+                    self.stats['stalls'] += 1
+                    logger.warning(f"SD lenta: {len(block) / 1e6:.1f} MB tardaron {elapsed:.2f} s")
+            if self.fsync_policy == 'file':
+                start = time.monotonic()
+                os.fsync(out.fileno())
+                self.histogram.record(time.monotonic() - start)
+            # No dejar el archivo copiado ocupando la caché de páginas
+            os.posix_fadvise(out.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        
+        os.replace(partial, dest)
+        path.unlink()
+        self.stats['flushed_files'] += 1
+        self.stats['flushed_bytes'] += size
+        logger.info(f"Staging volcado a SD: {dest} ({size / 1e6:.1f} MB)")
+        
+        if controller and controller.offload:
+            controller.offload.enqueue(dest)
+        return dest
+    
+    def get_status(self):
+        """Estado del staging e histograma de escrituras a la SD"""
+        return {
+            'enabled': self.enabled,
+            'used_bytes': self.used_bytes() if self.enabled else 0,
+            'max_bytes': self.max_bytes,
+            'write_latency': self.histogram.to_dict(),
+            **self.stats
+        }
+    
+    def stop(self):
+        """Detiene el volcado y vuelca lo que quede (el tmpfs no sobrevive un reinicio)
+
+        Con la SD trabada write() no retorna: la espera total se limita a
+        STOP_TIMEOUT y lo que no alcance a volcarse queda en el staging,
+        donde start() lo retoma si el servicio se reinicia sin reiniciar la Pi.
+        """
+        if not self.is_running:
+            return
+        with self.flush_lock:
+            self.is_running = False
+        deadline = time.monotonic() + self.STOP_TIMEOUT
+        
+        # En paralelo con el archivo que el thread de volcado tenga a medias
+        final = threading.Thread(target=self._flush_remaining, args=(deadline,),
+                                 daemon=True, name="StagingFinalFlush")
+        final.start()
+        for thread in (final, *self.threads):
+            thread.join(timeout=max(0, deadline - time.monotonic()))
+        
+        left = self._finished_files(include_active=True)
+        if left:
+            logger.error(f"Staging: la SD no respondió en {self.STOP_TIMEOUT} s, quedan "
+                         f"{len(left)} archivos sin volcar en {self.path}: "
+                         f"{', '.join(path.name for path in left)}")
+    
+    def _flush_remaining(self, deadline):
+        """Volcado final hasta deadline, sin tocar el archivo que el thread de volcado dejó a medias"""
+        for path in self._finished_files(include_active=True):
+            if time.monotonic() > deadline:
+                break
+            if path == self.flushing or not path.exists():
+                continue
+            try:
+                self.flush_file(path)
+            except Exception as e:
+                logger.error(f"No se pudo volcar {path}: {e}")
+
+
+def run_staging_benchmark(config, duration=10, rate='4M', chunk_size=64 * 1024):
+    """Compara latencias de escritura del encoder: directo a la SD vs staging en RAM
+
+    Simula un encoder que escribe bloques de chunk_size al ritmo indicado y
+    mide cada write(). En modo staging se mide además el volcado en bloques
+    grandes a la SD, que corre en paralelo.
+    """
+    card_dir = Path(config['storage']['video_path']) / 'staging_benchmark'
+    staging = StagingManager(config)
+    staging.path = staging.path / 'benchmark'
+    card_dir.mkdir(parents=True, exist_ok=True)
+    staging.path.mkdir(parents=True, exist_ok=True)
+    rate = _parse_size(rate)
+    chunk = os.urandom(chunk_size)
+    
+    def simulate_encoder(directory, histogram, on_segment=None):
+        segment_bytes = rate * duration // 4
+        index, written = 0, 0
+        out = open(directory / f"bench_{index:03d}.bin", 'wb')
+        start = time.monotonic()
+        sent = 0
+        while time.monotonic() - start < duration:
+            write_start = time.monotonic()
+            out.write(chunk)
+            out.flush()
+            histogram.record(time.monotonic() - write_start)
+            sent += chunk_size
+            written += chunk_size
+            if on_segment and written >= segment_bytes:
+                out.close()
+                on_segment(Path(out.name))
+                index, written = index + 1, 0
+                out = open(directory / f"bench_{index:03d}.bin", 'wb')
+            delay = start + sent / rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        out.close()
+        return Path(out.name)
+    
+    direct = LatencyHistogram()
+    simulate_encoder(card_dir, direct)
+    
+    encoder = LatencyHistogram()
+    flusher = ThreadPoolExecutor(max_workers=1)
+    last = simulate_encoder(staging.path, encoder,
+                            on_segment=lambda path: flusher.submit(staging.flush_file, path, card_dir))
+    flusher.submit(staging.flush_file, last, card_dir)
+    flusher.shutdown(wait=True)
+    
+    shutil.rmtree(card_dir, ignore_errors=True)
+    shutil.rmtree(staging.path, ignore_errors=True)
+    return {
+        'rate_bytes_per_s': rate,
+        'chunk_bytes': chunk_size,
+        'direct_encoder_writes': direct.to_dict(),
+        'staged_encoder_writes': encoder.to_dict(),
+        'staged_flush_writes': staging.histogram.to_dict(),
+    }
+
+
+class ProcessPipe:
+    """Procesos encadenados (stdout → stdin) manejados como un solo Popen
+
+    Reemplaza a 'sh -c "a | b"': cada proceso es hijo directo, así que
+    wait(), terminate() y kill() llegan a todos y ninguno queda huérfano.
+    stdin es el del primero y pid el del último.
+    """
+    
+    def __init__(self, commands, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL):
+        self.processes = []
+        stdin = subprocess.PIPE
+        try:
+            for index, cmd in enumerate(commands):
+                last = index == len(commands) - 1
+                process = subprocess.Popen(
+                    cmd,
+                    stdin=stdin,
+                    stdout=stdout if last else subprocess.PIPE,
+                    stderr=stderr
+                )
+                if self.processes:
+                    # Solo el proceso siguiente lee: si muere, el anterior recibe SIGPIPE
+                    self.processes[-1].stdout.close()
+                self.processes.append(process)
+                stdin = process.stdout
+        except Exception:
+            self.kill()
+            raise
+        self.stdin = self.processes[0].stdin
+        self.pid = self.processes[-1].pid
+    
+    def poll(self):
+        codes = [process.poll() for process in self.processes]
+        return None if None in codes else codes[-1]
+    
+    def wait(self, timeout=None):
+        """Espera a todos; timeout es el total, no por proceso"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for process in self.processes:
+            process.wait(None if deadline is None else max(0, deadline - time.monotonic()))
+        return self.processes[-1].returncode
+    
+    def terminate(self):
+        """EOF al primero (FFmpeg bloqueado leyendo no atiende SIGTERM) y SIGTERM a todos"""
+        try:
+            self.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        for process in self.processes:
+            if process.poll() is None:
+                process.terminate()
+    
+    def kill(self):
+        for process in self.processes:
+            if process.poll() is None:
+                process.kill()
+
+
+class AdaptiveTimelapse:
+    """Grabación MJPEG que reduce los fps guardados cuando la escena está quieta
+
+    Un FFmpeg captura el MJPEG de la cámara y lo entrega por stdout como
+    multipart JPEG (cada frame con su Content-Length); este proceso decide
+    frame a frame si guardarlo y reenvía los elegidos, sin recodificar, a un
+    segundo FFmpeg que los escribe en Matroska con la hora real de llegada
+    como timestamp (fps variable), de modo que la reproducción coincide con
+    el tiempo real.
+    
+    La actividad se mide decodificando el JPEG a 1/8 de resolución en gris
+    (escalado DCT de libjpeg, barato) unas pocas veces por segundo.
+    
+    Con encode=True (modo 3) el FFmpeg de escritura codifica los frames
+    elegidos con el hardware encoder en lugar de copiarlos: la selección se
+    hace antes de codificar, así que no hay GOP que respetar. Con el H.264
+    de la cámara (modo 2) no aplica: solo se podrían descartar frames
+    enteros de GOP y medir la actividad exigiría decodificar H.264.
+    """
+    
+    BOUNDARY = b'--ffmpeg'
+    
+    def __init__(self, config, scheduler=None, encode=False):
+        self.config = config
+        self.camera_config = config['camera']
+        self.encode = encode
+        self.configure(config.get('timelapse', {}))
+        self.scheduler = scheduler or SchedulingManager(config)
+        self.capture_process = None
+        self.writer_process = None
+        self.write_lock = threading.Lock()
+        self.thread = None
+        self.filename = None
+        self.report = self._new_report()
+    
+    def configure(self, options):
+        """Aplica los umbrales de actividad (también en caliente)"""
+        self.static_fps = options.get('static_fps', 1)
+        self.static_after = options.get('static_after', 10)
+        self.threshold = options.get('motion_threshold', 4.0)
+        self.analysis_interval = 1.0 / options.get('analysis_fps', 5)
+    
+    @staticmethod
+    def _new_report():
+        return {
+            'frames_in': 0, 'frames_stored': 0, 'bytes_in': 0, 'bytes_stored': 0,
+            'analyses': 0, 'decision_cpu_s': 0.0, 'relay_cpu_s': 0.0, 'static_s': 0.0,
+        }
+    
+    def _capture_command(self):
+        camera = self.camera_config
+        return [
+            'ffmpeg',
+            '-loglevel', 'error', '-nostats',
+            '-f', 'v4l2',
+            '-input_format', 'mjpeg',
+            '-video_size', f"{camera['width']}x{camera['height']}",
+            '-framerate', str(camera['fps']),
+            '-i', f"/dev/video{camera['device_id']}",
+            '-c:v', 'copy',
+            '-flush_packets', '1',
+            '-f', 'mpjpeg',
+            'pipe:1'
+        ]
+    
+    def _writer_commands(self, filename):
+        """Comandos del FFmpeg de escritura: uno, o dos encadenados con encode"""
+        copy_cmd = [
+            'ffmpeg',
+            '-loglevel', 'error', '-nostats',
+            '-use_wallclock_as_timestamps', '1',
+            '-f', 'mjpeg',
+            '-i', 'pipe:0',
+            '-c:v', 'copy',
+            '-f', 'matroska',
+        ]
+        if not self.encode:
+            return [copy_cmd + ['-y', str(filename)]]
+        
+        # Modo 3: al decodificar el MJPEG crudo FFmpeg descarta la hora de
+        # llegada, así que primero se fija en un Matroska (copy) y el segundo
+        # FFmpeg codifica respetando esos timestamps. bitrate se lee en cada roll.
+        encode_cmd = [
+            'ffmpeg',
+            '-loglevel', 'error', '-nostats',
+            '-f', 'matroska',
+            '-i', 'pipe:0',
+            '-c:v', 'h264_v4l2m2m',
+            '-b:v', self.config.get('bitrate', '4M'),
+            '-pix_fmt', 'yuv420p',
+            '-g', str(self.camera_config['fps'] * 2),
+            '-vsync', 'passthrough',  # fps variable, sin duplicar frames
+            '-f', 'matroska',
+            '-y',
+            str(filename)
+        ]
+        return [copy_cmd + ['pipe:1'], encode_cmd]
+    
+    def start(self, filename):
+        """Lanza ambos FFmpeg y el thread que selecciona los frames"""
+        self.filename = Path(filename)
+        
+        self.writer_process = self._start_writer(filename)
+        capture_cmd = self.scheduler.prepare_command('recording', self._capture_command())
+        self.capture_process = subprocess.Popen(
+            capture_cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+        self.scheduler.report_process('recording', self.capture_process.pid)
+        
+        self.thread = threading.Thread(target=self._relay, daemon=True, name="TimelapseThread")
+        self.thread.start()
+        logger.info(f"Timelapse adaptativo iniciado: {self.filename}")
+    
+    def _start_writer(self, filename):
+        commands = [self.scheduler.prepare_command('recording', cmd)
+                    for cmd in self._writer_commands(filename)]
+        if len(commands) > 1:
+            return ProcessPipe(commands)
+        return subprocess.Popen(
+            commands[0],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+    
+    def roll(self, filename):
+        """Continúa en un archivo nuevo sin cortar la captura
+
+        Solo se cambia el FFmpeg de escritura entre dos frames, así que no hay
+        hueco. Retorna (proceso, reporte) del archivo anterior; el llamador
+        debe esperar a que ese proceso termine de cerrar el archivo.
+        """
+        new_writer = self._start_writer(filename)
+        with self.write_lock:
+            old_writer, self.writer_process = self.writer_process, new_writer
+            report = self.get_report()
+            self.report = self._new_report()
+            self.filename = Path(filename)
+        old_writer.stdin.close()
+        logger.info(f"Timelapse continúa en {self.filename}")
+        return old_writer, report
+    
+    def _read_frame(self, stream):
+        """Lee el siguiente JPEG del stream multipart (None al terminar)"""
+        length = None
+        while True:
+            line = stream.readline()
+            if not line:
+                return None
+            line = line.strip()
+            if not line or line.startswith(self.BOUNDARY):
+                # Separador, o línea en blanco que cierra las cabeceras
+                if length is not None and not line:
+                    break
+                continue
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b'content-length':
+                length = int(value)
+        
+        data = stream.read(length)
+        return data if len(data) == length else None
+    
+    def _write_frame(self, data):
+        # Vaciar el buffer en cada frame: el timestamp es la hora en que llega a FFmpeg
+        self.writer_process.stdin.write(data)
+        self.writer_process.stdin.flush()
+    
+    def _relay(self):
+        """Selecciona frames: todos con actividad, static_fps en escena quieta"""
+        cpu_last = time.thread_time()
+        previous = None
+        last_motion = last_analysis = last_stored = now = time.monotonic()
+        
+        try:
+            while True:
+                data = self._read_frame(self.capture_process.stdout)
+                if data is None:
+                    break
+                last_now, now = now, time.monotonic()
+                decision_cpu = None
+                
+                if now - last_analysis >= self.analysis_interval:
+                    last_analysis = now
+                    decision_start = time.thread_time()
+                    small = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+                    if small is not None:
+                        if previous is None or previous.shape != small.shape or \
+                                cv2.absdiff(small, previous).mean() > self.threshold:
+                            last_motion = now
+                        previous = small
+                    decision_cpu = time.thread_time() - decision_start
+                
+                active = now - last_motion < self.static_after
+                store = active or now - last_stored >= 1.0 / self.static_fps
+                
+                # Bajo lock: roll() puede cambiar el archivo de destino y el reporte
+                with self.write_lock:
+                    stats = self.report
+                    if store:
+                        self._write_frame(data)
+                        last_stored = now
+                        stats['frames_stored'] += 1
+                        stats['bytes_stored'] += len(data)
+                    stats['frames_in'] += 1
+                    stats['bytes_in'] += len(data)
+                    if decision_cpu is not None:
+                        stats['analyses'] += 1
+                        stats['decision_cpu_s'] += decision_cpu
+                    if not active:
+                        stats['static_s'] += now - last_now
+                    cpu_now = time.thread_time()
+                    stats['relay_cpu_s'] += cpu_now - cpu_last
+                    cpu_last = cpu_now
+        except (BrokenPipeError, ValueError) as e:
+            logger.error(f"Timelapse: FFmpeg de escritura terminó ({e})")
+        finally:
+            try:
+                self.writer_process.stdin.close()
+            except (BrokenPipeError, OSError):
+                pass
+    
+    def stop(self):
+        """Detiene la captura, espera a que se cierre el archivo y retorna el reporte"""
+        if self.capture_process:
+            try:
+                self.capture_process.stdin.write(b'q')
+                self.capture_process.stdin.flush()
+                self.capture_process.wait(timeout=5)
+            except Exception:
+                self.capture_process.terminate()
+                self.capture_process.wait(timeout=2)
+        if self.thread:
+            self.thread.join(timeout=5)
+        if self.writer_process:
+            try:
+                self.writer_process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.writer_process.terminate()
+                try:
+                    self.writer_process.wait(timeout=2)
+                except subprocess.TimeoutExpired:
+                    self.writer_process.kill()
+                    self.writer_process.wait()
+        
+        report = self.get_report()
+        logger.info(f"Timelapse finalizado {self.filename}: {report}")
+        return report
+    
+    def get_report(self):
+        """Ahorro de almacenamiento y coste de CPU de la grabación"""
+        stats = dict(self.report)
+        if stats.get('bytes_in'):
+            stats['storage_saved_percent'] = round(100 * (1 - stats['bytes_stored'] / stats['bytes_in']), 1)
+        if stats.get('analyses'):
+            stats['avg_decision_ms'] = round(stats['decision_cpu_s'] / stats['analyses'] * 1000, 2)
+        for key in ('decision_cpu_s', 'relay_cpu_s', 'static_s'):
+            if key in stats:
+                stats[key] = round(stats[key], 2)
+        stats['filename'] = str(self.filename)
+        return stats
+
+
+class JobManager:
+    """Ejecuta comandos largos (start/stop) en segundo plano
+
+    submit() retorna de inmediato un job con id; el avance y el resultado se
+    notifican con eventos no solicitados vía notify(evento). Si el último job
+    encolado es del mismo tipo y sigue en curso, se retorna ese mismo job en
+    lugar de crear otro; cualquier otro comando entre medio rompe la
+    deduplicación, así el último comando recibido es el que queda aplicado.
+    """
+    
+    ACTIVE_STATES = ('queued', 'running')
+    
+    def __init__(self, notify, max_workers=1, history=50):
+        self.notify = notify
+        self.history = history
+        # Un solo worker: los comandos de grabación se ejecutan en orden
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="JobThread")
+        self.jobs = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+    
+    def submit(self, command, fn):
+        """Encola fn(progress) como job; retorna (job, duplicado)"""
+        with self.lock:
+            # Solo contra el último: start, stop, start debe terminar grabando
+            last = next(reversed(self.jobs.values()), None)
+            if last and last['command'] == command and last['state'] in self.ACTIVE_STATES:
+                return dict(last), True
+            
+            job_id = next(self.ids)
+            job = {
+                'id': job_id,
+                'command': command,
+                'state': 'queued',
+                'stage': None,
+                'result': None,
+                'error': None,
+                'created_at': time.time(),
+            }
+            self.jobs[job_id] = job
+            self._trim_history()
+        
+        self.executor.submit(self._run, job_id, fn)
+        return dict(job), False
+    
+    def _run(self, job_id, fn):
+        self._update(job_id, state='running', started_at=time.time())
+        self._push(job_id, 'job_started')
+        
+        def progress(stage):
+            self._update(job_id, stage=stage)
+            self._push(job_id, 'job_progress')
+        
+        try:
+            result = fn(progress)
+            self._update(job_id, state='done' if result else 'failed', result=result)
+        except Exception as e:
+            logger.error(f"Error en job {job_id}: {e}")
+            self._update(job_id, state='failed', error=str(e))
+        
+        self._update(job_id, finished_at=time.time())
+        self._push(job_id, 'job_finished')
+    
+    def _update(self, job_id, **fields):
+        with self.lock:
+            self.jobs[job_id].update(fields)
+    
+    def _push(self, job_id, event):
+        """Envía un evento no solicitado con el estado del job"""
+        job = self.get(job_id)
+        self.notify({
+            'event': event,
+            'job': job_id,
+            'command': job['command'],
+            'state': job['state'],
+            'stage': job['stage'],
+            'error': job['error'],
+        })
+    
+    def _trim_history(self):
+        """Descarta los jobs terminados más antiguos"""
+        finished = [job_id for job_id, job in self.jobs.items() if job['state'] not in self.ACTIVE_STATES]
+        for job_id in finished[:max(0, len(self.jobs) - self.history)]:
+            del self.jobs[job_id]
+    
+    def get(self, job_id):
+        """Retorna una copia del job o None si no existe"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+    
+    def active(self):
+        """Retorna los ids de jobs en curso"""
+        with self.lock:
+            return [job_id for job_id, job in self.jobs.items() if job['state'] in self.ACTIVE_STATES]
+    
+    def shutdown(self):
+        """Cancela jobs pendientes sin esperar al que está en curso"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
 class UARTController:
     """Controla comunicación UART del header GPIO"""
     
-    def __init__(self, config, camera_controller):
+    def __init__(self, config, camera_controller, scheduler=None):
         self.config = config
         self.camera_controller = camera_controller
+        self.scheduler = scheduler or SchedulingManager(config)
         self.serial_port = None
         self.is_running = False
+        # Comandos largos asíncronos con eventos de fin por UART
+        self.jobs = JobManager(self.send_uart_data)
+        self.write_lock = threading.Lock()
+        # Tiempo de respuesta a comandos (para verificar el efecto del scheduling)
+        self.response_count = 0
+        self.response_time_total = 0.0
+        self.response_time_max = 0.0
         
     def initialize_uart(self):
         """Inicializa puerto UART"""
@@ -395,6 +2605,7 @@ class UARTController:
     def uart_communication_loop(self):
         """Loop principal de comunicación UART"""
         logger.info("Iniciando loop de comunicación UART")
+        self.scheduler.apply_to_current_thread('uart')
         self.is_running = True
         
         while self.is_running:
@@ -404,12 +2615,14 @@ class UARTController:
                     data = self.serial_port.readline().decode('utf-8').strip()
                     
                     if data:
+                        received_at = time.monotonic()
                         logger.info(f"UART RX: {data}")
                         response = self.process_uart_command(data)
                         
                         # Enviar respuesta
                         if response:
                             self.send_uart_data(response)
+                        self._record_response_time(time.monotonic() - received_at)
                 
                 time.sleep(0.01)  # Pequeña pausa
                 
@@ -421,6 +2634,20 @@ class UARTController:
                 logger.error(f"Error inesperado en UART loop: {e}")
                 time.sleep(1)
     
+    def _record_response_time(self, elapsed):
+        """Acumula estadísticas del tiempo de respuesta a comandos"""
+        self.response_count += 1
+        self.response_time_total += elapsed
+        self.response_time_max = max(self.response_time_max, elapsed)
+    
+    def get_metrics(self):
+        """Retorna estadísticas de respuesta del UART"""
+        return {
+            'commands': self.response_count,
+            'avg_response_ms': round(self.response_time_total / self.response_count * 1000, 2) if self.response_count else None,
+            'max_response_ms': round(self.response_time_max * 1000, 2),
+        }
+    
     def process_uart_command(self, data):
         """Procesa comandos recibidos por UART"""
         try:
@@ -441,12 +2668,17 @@ class UARTController:
             cmd_type = command.get('type', '').lower()
             
             if cmd_type == 'start':
-                success = self.camera_controller.start_recording()
-                return {"status": "ok" if success else "error", "command": "start_recording"}
+                return self._submit_job('start_recording',
+                                        lambda progress: self.camera_controller.start_recording())
                 
             elif cmd_type == 'stop':
-                success = self.camera_controller.stop_recording()
-                return {"status": "ok" if success else "error", "command": "stop_recording"}
+                return self._submit_job('stop_recording', self.camera_controller.stop_recording)
+                
+            elif cmd_type == 'job':
+                job = self.jobs.get(int(command.get('id', command.get('value', 0))))
+                if job is None:
+                    return {"status": "error", "message": "job no encontrado"}
+                return {"status": "ok", "job": job}
                 
             elif cmd_type == 'zoom':
                 value = float(command.get('value', 1.0))
@@ -464,11 +2696,31 @@ class UARTController:
                 return {"status": "ok", "command": "brightness", "value": value}
                 
             elif cmd_type == 'status':
-                return {
+                response = {
                     "status": "ok",
                     "recording": self.camera_controller.is_recording,
-                    "filename": str(self.camera_controller.current_filename) if self.camera_controller.current_filename else None
+                    "filename": str(self.camera_controller.current_filename) if self.camera_controller.current_filename else None,
+                    "jobs": self.jobs.active()
+                }
+                if self.camera_controller.pipeline:
+                    response["pipeline"] = self.camera_controller.pipeline.get_stats()
+                return response
+                
+            elif cmd_type == 'metrics':
+                response = {
+                    "status": "ok",
+                    "uart": self.get_metrics(),
+                    "scheduling": self.scheduler.get_metrics(),
+                    "offload": self.camera_controller.offload.get_status() if self.camera_controller.offload else None,
+                    "staging": self.camera_controller.staging.get_status()
                 }
+                if self.camera_controller.timelapse:
+                    response["timelapse"] = self.camera_controller.timelapse.get_report()
+                elif self.camera_controller.last_timelapse_report:
+                    response["timelapse"] = self.camera_controller.last_timelapse_report
+                if self.camera_controller.pipeline:
+                    response["pipeline"] = self.camera_controller.pipeline.get_stats()
+                return response
                 
             elif cmd_type == 'ping':
                 return {"status": "ok", "message": "pong"}
@@ -480,6 +2732,14 @@ class UARTController:
             logger.error(f"Error al procesar comando UART: {e}")
             return {"status": "error", "message": str(e)}
     
+    def _submit_job(self, command, fn):
+        """Lanza un comando largo como job y responde de inmediato con su id"""
+        job, duplicate = self.jobs.submit(command, fn)
+        response = {"status": "ok", "command": command, "job": job['id'], "state": job['state']}
+        if duplicate:
+            response["duplicate"] = True
+        return response
+    
     def send_uart_data(self, data):
         """Envía datos por UART"""
         try:
@@ -488,8 +2748,9 @@ class UARTController:
                 if isinstance(data, dict):
                     data = json.dumps(data)
                 
-                # Enviar con newline
-                self.serial_port.write(f"{data}\n".encode('utf-8'))
+                # Enviar con newline (respuestas y eventos de jobs desde varios threads)
+                with self.write_lock:
+                    self.serial_port.write(f"{data}\n".encode('utf-8'))
                 logger.info(f"UART TX: {data}")
                 
         except Exception as e:
@@ -499,40 +2760,346 @@ class UARTController:
         """Limpia recursos UART"""
         logger.info("Limpiando recursos UART")
         self.is_running = False
+        self.jobs.shutdown()
         
         if self.serial_port and self.serial_port.is_open:
             self.serial_port.close()
 
 
+# Esquema de config.json. Cada hoja indica tipo y restricciones; 'live' marca
+# los valores que se pueden cambiar sin reiniciar la captura y 'roll' los que
+# además obligan a pasar la grabación en curso a un archivo nuevo.
+_CPU_LIST = {'type': list, 'items': int, 'min': 0}
+
+CONFIG_SCHEMA = {
+    'camera': {
+        'device_id': {'type': int, 'min': 0},
+        'width': {'type': int, 'min': 160, 'max': 7680},
+        'height': {'type': int, 'min': 120, 'max': 4320},
+        'fps': {'type': int, 'min': 1, 'max': 120},
+    },
+    'storage': {
+        'video_path': {'type': str, 'live': True, 'roll': True},
+    },
+    'uart': {
+        'port': {'type': str},
+        'baudrate': {'type': int, 'min': 1200},
+        'bytesize': {'type': int, 'choices': [5, 6, 7, 8]},
+        'parity': {'type': str, 'choices': ['N', 'E', 'O', 'M', 'S']},
+        'stopbits': {'type': (int, float), 'choices': [1, 1.5, 2]},
+        'timeout': {'type': (int, float), 'min': 0},
+    },
+    'use_hardware_encoder': {'type': bool},
+    'use_camera_h264': {'type': bool},
+    'use_mjpeg_raw': {'type': bool},
+    # 'modes': modos de grabación en los que la clave tiene efecto (ver recording_mode)
+    'bitrate': {'type': str, 'pattern': r'^\d+(\.\d+)?[KM]?$', 'live': True, 'roll': True,
+                'modes': ['encoder', 'timelapse_encoder']},
+    'auto_start_recording': {'type': bool, 'live': True},
+    'pipeline': {
+        'enabled': {'type': bool},
+        'workers': {'type': int, 'min': 1, 'max': 16},
+        'slots': {'type': int, 'min': 2, 'max': 64},
+        'processor': {'type': str, 'choices': list(FRAME_PROCESSORS)},
+        'backpressure': {'type': str, 'choices': ['drop', 'block']},
+    },
+    'scheduling': {
+        'enabled': {'type': bool},
+        'ffmpeg_cpus': _CPU_LIST,
+        'control_cpus': _CPU_LIST,
+        'background_cpus': _CPU_LIST,
+        'ffmpeg_nice': {'type': int, 'min': -20, 'max': 19},
+        'uart_policy': {'type': str, 'choices': ['fifo', 'rr', 'nice', 'none']},
+        'uart_priority': {'type': int, 'min': 1, 'max': 99},
+        'uart_nice': {'type': int, 'min': -20, 'max': 19},
+        'background_nice': {'type': int, 'min': -20, 'max': 19},
+        'background_ionice': {'type': bool},
+    },
+    'offload': {
+        'enabled': {'type': bool},
+        'target': {'type': str},
+        'chunk_size': {'type': int, 'min': 65536},
+        'concurrency': {'type': int, 'min': 1, 'max': 8},
+        'bandwidth_limit': {'type': (str, int), 'pattern': r'^\d+(\.\d+)?[KMG]?$', 'live': True},
+        'recording_bandwidth_limit': {'type': (str, int), 'pattern': r'^\d+(\.\d+)?[KMG]?$', 'live': True},
+        'retry_interval': {'type': (int, float), 'min': 1, 'live': True},
+    },
+    'timelapse': {
+        'enabled': {'type': bool},
+        'static_after': {'type': (int, float), 'min': 0, 'live': True},
+        'static_fps': {'type': (int, float), 'min': 0.01, 'live': True},
+        'motion_threshold': {'type': (int, float), 'min': 0, 'max': 255, 'live': True},
+        'analysis_fps': {'type': (int, float), 'min': 0.1, 'live': True},
+    },
+    'staging': {
+        'enabled': {'type': bool},
+        'path': {'type': str},
+        'max_bytes': {'type': (str, int), 'pattern': r'^\d+(\.\d+)?[KMG]?$'},
+        'flush_block': {'type': (str, int), 'pattern': r'^\d+(\.\d+)?[KMG]?$'},
+        'fsync': {'type': str, 'choices': ['block', 'file', 'none']},
+        'high_watermark': {'type': (int, float), 'min': 0.1, 'max': 1},
+        'segment_seconds': {'type': int, 'min': 1},
+        'stream_bitrate': {'type': (str, int), 'pattern': r'^\d+(\.\d+)?[KMG]?$'},
+    },
+}
+
+
+class ConfigError(Exception):
+    """Configuración inválida; errors tiene un mensaje por problema"""
+    
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__('; '.join(errors))
+
+
+def _is_schema_leaf(schema):
+    return 'type' in schema
+
+
+def _check_value(path, value, rule):
+    """Valida un valor contra su regla; retorna lista de errores"""
+    expected = rule['type']
+    types = expected if isinstance(expected, tuple) else (expected,)
+    # bool es subclase de int: no aceptar true/false donde va un número
+    if (isinstance(value, bool) and bool not in types) or not isinstance(value, types):
+        names = ' o '.join(t.__name__ for t in types)
+        return [f"{path}: se esperaba {names}, se recibió {type(value).__name__} ({value!r})"]
+    
+    if expected is list:
+        errors = []
+        for i, item in enumerate(value):
+            errors += _check_value(f"{path}[{i}]", item, {**rule, 'type': rule['items']})
+        return errors
+    
+    if 'choices' in rule and value not in rule['choices']:
+        return [f"{path}: valor {value!r} no válido, opciones: {rule['choices']}"]
+    if 'min' in rule and value < rule['min']:
+        return [f"{path}: {value} es menor que el mínimo {rule['min']}"]
+    if 'max' in rule and value > rule['max']:
+        return [f"{path}: {value} es mayor que el máximo {rule['max']}"]
+    if 'pattern' in rule and isinstance(value, str) and not re.match(rule['pattern'], value):
+        return [f"{path}: formato no válido {value!r} (ejemplos: '8M', '512K')"]
+    return []
+
+
+def validate_config(config, schema=CONFIG_SCHEMA, prefix=''):
+    """Valida la configuración contra el esquema; retorna lista de errores"""
+    errors = []
+    for key, value in config.items():
+        path = f"{prefix}{key}"
+        if key not in schema:
+            suggestion = difflib.get_close_matches(key, list(schema), n=1)
+            hint = f" (¿quiso decir '{prefix}{suggestion[0]}'?)" if suggestion else ""
+            errors.append(f"{path}: clave desconocida{hint}")
+            continue
+        
+        rule = schema[key]
+        if _is_schema_leaf(rule):
+            errors += _check_value(path, value, rule)
+        elif not isinstance(value, dict):
+            errors.append(f"{path}: se esperaba una sección (objeto JSON)")
+        else:
+            errors += validate_config(value, rule, f"{path}.")
+    
+    if not prefix:
+        offload = config.get('offload', {})
+        if isinstance(offload, dict) and offload.get('enabled') and not offload.get('target'):
+            errors.append("offload.target: requerido cuando offload.enabled es true")
+        errors += _check_staging_budget(config) if not errors else []
+    return errors
+
+
+def _check_staging_budget(config):
+    """Rechaza un staging que no entra en la memoria o no alcanza para un segmento mínimo"""
+    options = config.get('staging', {})
+    if not options.get('enabled', False):
+        return []
+    limit = StagingManager.memory_limit()
+    max_bytes = _parse_size(options.get('max_bytes', '128M'))
+    if limit and max_bytes > limit * StagingManager.MEMORY_SHARE:
+        return [
+            f"staging.max_bytes: {max_bytes / 1e6:.0f} MB supera el "
+            f"{StagingManager.MEMORY_SHARE:.0%} del límite de memoria ({limit / 1e6:.0f} MB); "
+            f"el tmpfs cuenta en ese límite y con FFmpeg y OpenCV puede activar el OOM killer"
+        ]
+    if not config.get('use_hardware_encoder', True):
+        return []  # Software: se cambia de archivo por tamaño, no por tiempo
+    if (config.get('timelapse', {}).get('enabled', False) and
+            (config.get('use_mjpeg_raw', False) or not config.get('use_camera_h264', False))):
+        return []  # Timelapse: idem, no usa el muxer 'segment'
+    seconds, bytes_per_second, keyframe = StagingManager.segment_plan(config)
+    if seconds >= StagingManager.MIN_SEGMENT_SECONDS:
+        return []
+    needed = 4 * bytes_per_second * (StagingManager.MIN_SEGMENT_SECONDS + keyframe)
+    return [
+        f"staging.max_bytes: un segmento de {StagingManager.MIN_SEGMENT_SECONDS:.0f} s a "
+        f"~{bytes_per_second / 1e6:.1f} MB/s no cabe en max_bytes / 4; se necesitan al menos "
+        f"{needed / 1e6:.0f} MB (o fijar staging.stream_bitrate con el bitrate real)"
+    ]
+
+
+def _config_leaves(config, schema=CONFIG_SCHEMA, prefix=''):
+    """Aplana la configuración a {ruta.con.puntos: (valor, regla)}"""
+    leaves = {}
+    for key, rule in schema.items():
+        if key not in config:
+            continue
+        path = f"{prefix}{key}"
+        if _is_schema_leaf(rule):
+            leaves[path] = (config[key], rule)
+        else:
+            leaves.update(_config_leaves(config[key], rule, f"{path}."))
+    return leaves
+
+
+def _set_config_value(config, path, value):
+    """Asigna (o elimina si value es None) una ruta con puntos, in-place"""
+    *sections, key = path.split('.')
+    for section in sections:
+        config = config.setdefault(section, {})
+    if value is None:
+        config.pop(key, None)
+    else:
+        config[key] = value
+
+
 class CameraSystem:
     """Sistema principal que coordina cámara y UART"""
     
     def __init__(self, config_path='/etc/camera_system/config.json'):
+        self.config_path = config_path
         self.config = self.load_config(config_path)
-        self.camera_controller = CameraController(self.config)
-        self.uart_controller = UARTController(self.config, self.camera_controller)
+        self.config_stamp = self._config_file_stamp()
+        self.reload_requested = False
+        self.stop_requested = False
+        self.restart_required = []
+        self.scheduler = SchedulingManager(self.config)
+        self.offload_manager = OffloadManager(
+            self.config, self.scheduler,
+            is_recording=lambda: self.camera_controller.is_recording
+        )
+        self.camera_controller = CameraController(self.config, self.scheduler, self.offload_manager)
+        self.uart_controller = UARTController(self.config, self.camera_controller, self.scheduler)
         self.threads = []
         self.is_running = False
         
         # Configurar señales para shutdown limpio
         signal.signal(signal.SIGINT, self.signal_handler)
         signal.signal(signal.SIGTERM, self.signal_handler)
+        # SIGHUP: recargar configuración sin reiniciar
+        signal.signal(signal.SIGHUP, self.reload_signal_handler)
     
-    def load_config(self, config_path):
-        """Carga configuración desde archivo JSON"""
+    @classmethod
+    def load_config(cls, config_path):
+        """Carga y valida configuración desde archivo JSON
+
+        Los valores ausentes se completan con get_default_config(). Un JSON mal
+        formado o un valor inválido lanza ConfigError con el detalle de cada
+        problema; solo un archivo inexistente usa los valores por defecto.
+        """
+        config = cls.get_default_config()
         try:
             with open(config_path, 'r') as f:
-                config = json.load(f)
-            logger.info(f"Configuración cargada desde {config_path}")
-            return config
+                loaded = json.load(f)
         except FileNotFoundError:
             logger.warning(f"Archivo de configuración no encontrado, usando valores por defecto")
-            return self.get_default_config()
-        except Exception as e:
-            logger.error(f"Error al cargar configuración: {e}")
-            return self.get_default_config()
+            return config
+        except json.JSONDecodeError as e:
+            raise ConfigError([f"{config_path}: JSON inválido en línea {e.lineno}, columna {e.colno}: {e.msg}"])
+        
+        if not isinstance(loaded, dict):
+            raise ConfigError([f"{config_path}: se esperaba un objeto JSON"])
+        errors = validate_config(loaded)
+        if errors:
+            raise ConfigError(errors)
+        
+        for key, value in loaded.items():
+            if isinstance(value, dict):
+                config.setdefault(key, {}).update(value)
+            else:
+                config[key] = value
+        logger.info(f"Configuración cargada desde {config_path}")
+        return config
     
-    def get_default_config(self):
+    def _config_file_stamp(self):
+        try:
+            stat = os.stat(self.config_path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+    
+    def reload_signal_handler(self, signum, frame):
+        """SIGHUP: la recarga se hace en el loop principal, no en el handler"""
+        logger.info("SIGHUP recibido: recargando configuración")
+        self.reload_requested = True
+    
+    def reload_config(self):
+        """Recarga la configuración y aplica en caliente lo que se puede
+
+        Un archivo inválido nunca reemplaza la configuración en uso. Los
+        valores 'live' se aplican (pasando la grabación a un archivo nuevo si
+        hace falta); los demás quedan marcados como pendientes de reinicio.
+        """
+        try:
+            new_config = self.load_config(self.config_path)
+        except ConfigError as e:
+            for error in e.errors:
+                logger.error(f"Configuración inválida, se mantiene la actual: {error}")
+            self.uart_controller.send_uart_data({"event": "config_error", "errors": e.errors})
+            return False
+        
+        current = _config_leaves(self.config)
+        updated = _config_leaves(new_config)
+        changed = sorted(path for path in set(current) | set(updated)
+                         if current.get(path, (None,))[0] != updated.get(path, (None,))[0])
+        
+        rules = {path: rule for path, (_, rule) in {**current, **updated}.items()}
+        mode = self.camera_controller.recording_mode()
+        live = [path for path in changed if rules[path].get('live')]
+        # Claves que el modo de grabación actual no usa: se guardan pero no cortan la grabación
+        no_effect = [path for path in live if mode not in rules[path].get('modes', [mode])]
+        applied = [path for path in live if path not in no_effect]
+        self.restart_required = [path for path in changed if not rules[path].get('live')]
+        
+        for path in live:
+            _set_config_value(self.config, path, updated.get(path, (None,))[0])
+        
+        if any(path.startswith('offload.') for path in applied):
+            self.offload_manager.update_limits(self.config)
+        if any(path.startswith('timelapse.') for path in applied) and self.camera_controller.timelapse:
+            self.camera_controller.timelapse.configure(self.config['timelapse'])
+        if any(rules[path].get('roll') for path in applied) and self.camera_controller.is_recording:
+            self.camera_controller.roll_recording()
+        
+        if applied:
+            logger.info(f"Configuración aplicada en caliente: {applied}")
+        if no_effect:
+            logger.info(f"Sin efecto en el modo de grabación actual ({mode}): {no_effect}")
+        if self.restart_required:
+            logger.warning(f"Cambios que requieren reiniciar el servicio: {self.restart_required}")
+        if changed:
+            self.uart_controller.send_uart_data({
+                "event": "config_reloaded",
+                "applied": applied,
+                "no_effect": no_effect,
+                "restart_required": self.restart_required
+            })
+        return True
+    
+    def _check_config_file(self):
+        """Recarga si llegó SIGHUP o si el archivo cambió"""
+        stamp = self._config_file_stamp()
+        if stamp != self.config_stamp:
+            self.config_stamp = stamp
+            logger.info(f"{self.config_path} modificado: recargando configuración")
+            self.reload_requested = True
+        
+        if self.reload_requested:
+            self.reload_requested = False
+            self.reload_config()
+    
+    @staticmethod
+    def get_default_config():
         """Retorna configuración por defecto"""
         return {
             "camera": {
@@ -555,10 +3122,14 @@ class CameraSystem:
         }
     
     def signal_handler(self, signum, frame):
-        """Maneja señales de sistema para shutdown limpio"""
+        """SIGINT/SIGTERM: el shutdown se hace en el loop principal, no en el handler
+
+        El handler corre en el thread principal, que puede estar dentro de un
+        roll o de start_recording() con recording_lock tomado; llamar a stop()
+        desde aquí se quedaría esperando ese mismo lock para siempre.
+        """
         logger.info(f"Señal recibida: {signum}")
-        self.stop()
-        sys.exit(0)
+        self.stop_requested = True
     
     def start(self):
         """Inicia el sistema completo"""
@@ -576,6 +3147,9 @@ class CameraSystem:
         
         self.is_running = True
         
+        # El thread principal es de control (los hijos del pipeline ya usan todos los cores)
+        self.scheduler.apply_to_current_thread('control')
+        
         # Iniciar thread de captura de frames
         camera_thread = threading.Thread(
             target=self.camera_controller.capture_frames,
@@ -594,24 +3168,33 @@ class CameraSystem:
         uart_thread.start()
         self.threads.append(uart_thread)
         
+        # Subida en segundo plano de grabaciones terminadas
+        self.offload_manager.start()
+        
+        # Volcado a la SD de lo grabado en RAM (incluye restos de una ejecución anterior)
+        self.camera_controller.staging.start()
+        
         logger.info("Sistema iniciado correctamente")
         logger.info("Esperando comandos por UART...")
         
         # Auto-iniciar grabación si está configurado
         if self.config.get('auto_start_recording', False):
             time.sleep(2)  # Esperar a que todo se estabilice
-            self.camera_controller.start_recording()
+            if not self.stop_requested:
+                self.camera_controller.start_recording()
         
         return True
     
     def run(self):
-        """Mantiene el sistema ejecutándose"""
+        """Mantiene el sistema ejecutándose hasta recibir SIGINT/SIGTERM"""
         try:
-            while self.is_running:
+            while self.is_running and not self.stop_requested:
                 time.sleep(1)
+                if not self.stop_requested:
+                    self._check_config_file()
         except KeyboardInterrupt:
             logger.info("Interrupción de teclado recibida")
-            self.stop()
+        self.stop()
     
     def stop(self):
         """Detiene el sistema limpiamente"""
@@ -619,8 +3202,10 @@ class CameraSystem:
         self.is_running = False
         
         # Limpiar recursos
-        self.camera_controller.cleanup()
+        # UART primero: cancela jobs pendientes antes de parar la grabación
         self.uart_controller.cleanup()
+        self.camera_controller.cleanup()
+        self.offload_manager.stop()
         
         # Esperar a que threads terminen
         for thread in self.threads:
@@ -632,12 +3217,58 @@ class CameraSystem:
 
 def main():
     """Función principal"""
+    # Benchmark del pipeline multiproceso con frames sintéticos
+    if '--benchmark-pipeline' in sys.argv:
+        results = run_pipeline_benchmark()
+        print(json.dumps(results, indent=2))
+        return
+    
+    # Latencias de escritura: directo a la SD vs staging en RAM
+    if '--benchmark-staging' in sys.argv:
+        system = CameraSystem()
+        print(json.dumps(run_staging_benchmark(system.config), indent=2))
+        return
+    
+    # Servidor local de prueba para el offload: --offload-server DIR [PUERTO]
+    if '--offload-server' in sys.argv:
+        args = sys.argv[sys.argv.index('--offload-server') + 1:]
+        server = run_offload_server(args[0] if args else '/tmp/offload', int(args[1]) if len(args) > 1 else 8000)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+        return
+    
+    # Validar un archivo de configuración: --check-config [RUTA]
+    if '--check-config' in sys.argv:
+        args = sys.argv[sys.argv.index('--check-config') + 1:]
+        path = args[0] if args else '/etc/camera_system/config.json'
+        try:
+            CameraSystem.load_config(path)
+        except ConfigError as e:
+            for error in e.errors:
+                print(f"ERROR {error}")
+            sys.exit(1)
+        print(f"OK {path}")
+        return
+    
+    # Verificar políticas de scheduling sin cámara ni UART
+    if '--check-scheduling' in sys.argv:
+        system = CameraSystem()
+        print(json.dumps(run_scheduling_check(system.config), indent=2))
+        return
+    
     # Verificar que se ejecuta como root o con permisos adecuados
     if os.geteuid() != 0:
         logger.warning("Se recomienda ejecutar como root para acceso completo a hardware")
     
     # Crear e iniciar sistema
-    system = CameraSystem()
+    try:
+        system = CameraSystem()
+    except ConfigError as e:
+        for error in e.errors:
+            logger.error(f"Configuración inválida: {error}")
+        sys.exit(1)
     
     if system.start():
         system.run()